@@ -67,6 +67,111 @@ def heading_md(level, text):
     return ('#' * level) + ' ' + text + '\n\n'
 
 
+TITLE_TAGS = {'part': 2, 'division': 3, 'subdivision': 4, 'schedule': 2}
+SECTION_TAGS = ('section', 'rule', 'regulation', 'article')
+BODY_TAGS = ('para', 'p', 'block', 'content')
+
+
+def title_md(elem):
+    """部份 / 條文等結構節點 → Markdown 標題（只看屬性，開始標籤即可決定）；非結構節點回傳 None"""
+    tag = strip_ns(elem.tag).lower()
+    if tag in TITLE_TAGS:
+        title = elem.get('title') or elem.get('name') or ''
+        return heading_md(TITLE_TAGS[tag], title) if title else None
+    if tag in SECTION_TAGS:
+        title = elem.get('title') or elem.get('name') or ''
+        num = elem.get('num') or elem.get('number') or ''
+        head = f'{num} {title}'.strip()
+        return heading_md(4, head) if head else None
+    return None
+
+
+def collect_tree(xml_path):
+    """ET.parse 整棵樹，回傳 (meta, heads, bodies)"""
+    root = ET.parse(xml_path).getroot()
+    heads = []
+    for elem in root.iter():
+        if strip_ns(elem.tag).lower() == 'heading':
+            heads.append(('heading', text_content(elem)))
+        else:
+            md = title_md(elem)
+            if md is not None:
+                heads.append(('md', md))
+    bodies = {tag: [text_content(e) for e in root.findall(f'.//{{*}}{tag}')] for tag in BODY_TAGS}
+    return gather_meta(root), heads, bodies
+
+
+def collect_streaming(xml_path):
+    """iterparse 串流版 collect_tree：結果相同，處理完的節點即時釋放，不必把整棵 XML 樹留在記憶體
+
+    收集到的標題與內文仍全部留在記憶體（render_body 先輸出全部標題、再按標籤輸出內文，無法邊解析邊寫出），
+    峰值記憶體約與輸出的 Markdown 大小相當，而不是 XML 樹的數倍。
+    """
+    meta, heads, bodies = {}, [], {tag: [] for tag in BODY_TAGS}
+    stack = []
+    head_slots, body_slots = {}, {}
+    hold = 0      # 開啟中的 heading / 內文節點；其子節點要留到它們結束才釋放
+    in_meta = 0
+
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        tag = strip_ns(elem.tag)
+        if event == 'start':
+            # 開始標籤先佔位，保持與 root.iter() / findall 相同的先序次序
+            if tag.lower() == 'heading':
+                head_slots[elem] = len(heads)
+                heads.append(None)
+                hold += 1
+            else:
+                md = title_md(elem)
+                if md is not None:
+                    heads.append(('md', md))
+            if tag in BODY_TAGS and stack:
+                body_slots[elem] = len(bodies[tag])
+                bodies[tag].append(None)
+                hold += 1
+            if tag == 'meta' and stack:
+                in_meta += 1
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if tag == 'property' and in_meta:
+            k = elem.get('name') or elem.get('ref') or tag
+            if k:
+                meta[k] = (elem.text or '').strip()
+        elif tag == 'meta' and stack:
+            in_meta -= 1
+        if elem in head_slots:
+            heads[head_slots.pop(elem)] = ('heading', text_content(elem))
+            hold -= 1
+        if elem in body_slots:
+            bodies[tag][body_slots.pop(elem)] = text_content(elem)
+            hold -= 1
+        if hold == 0 and stack:
+            stack[-1].remove(elem)
+
+    return meta, heads, bodies
+
+
+def render_body(chap_title, cap_no, heads, bodies):
+    body = []
+    if chap_title:
+        body.append(heading_md(1, f'{chap_title} (Cap. {cap_no})'))
+
+    for kind, value in heads:
+        if kind == 'md':
+            body.append(value)
+        elif value and value != chap_title:
+            body.append(heading_md(3, value))
+
+    for tag in BODY_TAGS:
+        for t in bodies[tag]:
+            if t:
+                if not body or (t.strip() not in body[-1]):
+                    body.append(t + '\n\n')
+    return body
+
+
 def safe_clean_md(dirpath, logf=None):
     Path(dirpath).mkdir(parents=True, exist_ok=True)
     for name in os.listdir(dirpath):
@@ -78,11 +183,9 @@ def safe_clean_md(dirpath, logf=None):
                 log(f'[!] 無法刪除 {p}: {e}', logf)
 
 
-def build_markdown(xml_path, logf=None):
-    """將單一 XML 轉為 Markdown 字串，並回傳 (out_name, md_text)"""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    meta = gather_meta(root)
+def build_markdown(xml_path, logf=None, streaming=False):
+    """將單一 XML 轉為 Markdown 字串，並回傳 (out_name, md_text)；streaming=True 時以 iterparse 串流解析"""
+    meta, heads, bodies = (collect_streaming if streaming else collect_tree)(xml_path)
 
     fname = os.path.basename(xml_path)
     m = re.match(r'^(cap|a)_(.+?)_([0-9-]{14}|--------------)_(en|zh-Hant|zh-Hans)_(c|p)\.xml$', fname, re.I)
@@ -105,34 +208,7 @@ def build_markdown(xml_path, logf=None):
         front_matter_lines.append(f'{k}: "{s}"')
     front_matter = '---\n' + '\n'.join(front_matter_lines) + '\n---\n\n'
 
-    body = []
-    if chap_title:
-        body.append(heading_md(1, f'{chap_title} (Cap. {cap_no})'))
-
-    for elem in root.iter():
-        tag = strip_ns(elem.tag).lower()
-        if tag in ('part', 'division', 'subdivision', 'schedule'):
-            title = elem.get('title') or elem.get('name') or ''
-            if title:
-                level = {'part': 2, 'division': 3, 'subdivision': 4, 'schedule': 2}[tag]
-                body.append(heading_md(level, title))
-        elif tag in ('section', 'rule', 'regulation', 'article'):
-            title = elem.get('title') or elem.get('name') or ''
-            num = elem.get('num') or elem.get('number') or ''
-            head = f'{num} {title}'.strip()
-            if head:
-                body.append(heading_md(4, head))
-        elif tag in ('heading',):
-            head = text_content(elem)
-            if head and head != chap_title:
-                body.append(heading_md(3, head))
-
-    for xpath in ('.//{*}para', './/{*}p', './/{*}block', './/{*}content'):
-        for e in root.findall(xpath):
-            t = text_content(e)
-            if t:
-                if not body or (t.strip() not in body[-1]):
-                    body.append(t + '\n\n')
+    body = render_body(chap_title, cap_no, heads, bodies)
 
     md = front_matter + ''.join(body).strip() + '\n'
     out_name = f'cap_{cap_no}_{"current" if fm["version"] == "current" else fm["version"]}_{lang}.md'
@@ -158,6 +234,7 @@ def main():
     ap.add_argument('--out', dest='out_dir', default=None, help='如未加 --no-local-md 時，寫出 MD 的資料夾')
     ap.add_argument('--log', default=None)
     ap.add_argument('--clean', action='store_true', help='先清空 out 目錄中的 .md（僅本地）')
+    ap.add_argument('--stream', action='store_true', help='以 iterparse 串流解析（超大 XML 用，不必載入整棵樹；記憶體約與輸出的 Markdown 大小相當）')
 
     # GCS 相關
     ap.add_argument('--gcs-bucket', help='要上傳的目標 Bucket 名稱')
@@ -192,7 +269,7 @@ def main():
     ok = 0
     for i, fp in enumerate(sorted(files), 1):
         try:
-            out_name, md_text = build_markdown(fp, args.log)
+            out_name, md_text = build_markdown(fp, args.log, streaming=args.stream)
 
             # 上傳到 GCS（如指定）
             if gcs_bucket:
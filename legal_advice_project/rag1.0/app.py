@@ -3,12 +3,26 @@ import os
 from flask_cors import CORS
 
 # 匯入你原本的程式邏輯
-from rag_pipelinev2 import rag_search_with_rerank, generate_answer_with_review
+from rag_pipelinev2 import rag_search_with_rerank, generate_answer_with_review, reranker
 from contract_pipelinev2 import analyze_contract_file
+from retrieval_engine import context_and_sources
+from query_cache import QueryCache, file_version
+from model_registry import loaded as loaded_models
 
 app = Flask(__name__)
 CORS(app)  # 允許跨來源請求（給 React 用）
 
+# 檢索 + rerank 結果快取；更新 Vertex RAG corpus 後 touch RAG_INDEX_VERSION_FILE 即可讓快取失效
+query_cache = QueryCache(version_fn=lambda: os.getenv("RAG_CORPUS_NAME", "") + ":" + file_version(
+    os.getenv("RAG_INDEX_VERSION_FILE", "./rag_index_version")))
+
+
+def cached_search(query, n=10, top_k=3):
+    reranked, _ = query_cache.get_or_compute(
+        query, lambda: rag_search_with_rerank(query, n=n, top_k=top_k), n=n, top_k=top_k
+    )
+    return reranked
+
 
 @app.route("/ask", methods=["POST"])
 def ask():
@@ -18,14 +32,18 @@ def ask():
         return jsonify({"error": "Missing query"}), 400
 
     try:
-        reranked = rag_search_with_rerank(query, n=10, top_k=3)
-        context_texts = [doc for (doc, _, _, _), _ in reranked]
-        sources = [f"- {meta.get('law_name','')} {meta.get('section','')}" for (_, meta, _, _), _ in reranked]
+        reranked = cached_search(query, n=10, top_k=3)
+        context_texts, sources = context_and_sources(reranked)
         answer = generate_answer_with_review(query, context_texts, sources)
         return jsonify({"answer": answer})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({"query_cache": query_cache.stats(), "reranker": reranker.stats(), "models": loaded_models()})
+
+
 @app.route("/reports/<path:filename>")
 def download_report(filename):
     return send_from_directory("./reports", filename, as_attachment=True)
@@ -48,9 +66,8 @@ def analyze():
         # 直接使用 OCR 文本進行分析（不需要文件）
         try:
             # 使用 RAG 管道進行文本分析
-            reranked = rag_search_with_rerank(ocr_text, n=10, top_k=3)
-            context_texts = [doc for (doc, _, _, _), _ in reranked]
-            sources = [f"- {meta.get('law_name','')} {meta.get('section','')}" for (_, meta, _, _), _ in reranked]
+            reranked = cached_search(ocr_text, n=10, top_k=3)
+            context_texts, sources = context_and_sources(reranked)
             answer = generate_answer_with_review(ocr_text, context_texts, sources)
             
             # 對文本進行截斷以避免響應過大
@@ -1,21 +1,40 @@
 import os
+import re
+import time
+import shutil
+import hashlib
+import argparse
+import queue
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 import chromadb
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
-import pickle
-from rank_bm25 import BM25Okapi
-import jieba   # 中文斷詞
+from onnx_embedding import BACKENDS, resolve_backend
+from model_registry import get_encoder
+from legal_tokenizer import tokenize_corpus, tokenizer_signature   # 中文斷詞
+from bm25_index import BM25Index
+from embedding_cache import with_embedding_cache
+from quantized_store import QUANT_DTYPES, QuantizedVectorStore, QuantizedStoreWriter
 
 # ================== Embedding Function ==================
 class BGEEmbeddingFunction:
-    def __init__(self, model_name="thenlper/gte-large-zh"):   # 預設改成 gte-large-zh
-        print(f"📥 載入本地模型 {model_name} ...")
+    def __init__(self, model_name="thenlper/gte-large-zh", backend=None,   # 預設改成 gte-large-zh
+                 workers=None, threads_per_worker=None):
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
+        # backend: torch（SentenceTransformer）/ onnx / onnx-int8（見 onnx_embedding.py），預設讀 EMBEDDING_BACKEND
+        self.backend = resolve_backend(backend)
+        # 模型由 model_registry 共用；workers > 1 時為多 process 平行 encode（見 embedding_pool.py），主 process 不載入模型
+        self.model = get_encoder(model_name, self.backend, workers=workers, threads_per_worker=threads_per_worker)
+        if self.backend == "onnx-int8":
+            self.cache_namespace = f"{model_name}@onnx-int8"   # int8 向量與 float32 模型不共用快取
 
     def __call__(self, input: list[str]) -> list[list[float]]:
-        return self.model.encode(input, show_progress_bar=False).tolist()
+        return self.encode(input)
+
+    def encode(self, texts: list[str], batch_size=32) -> list[list[float]]:
+        """一次過把多個條文送進模型，批次大小交由 SentenceTransformer 處理"""
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False).tolist()
 
     def name(self) -> str:
         return f"sentence-transformers/{self.model_name}"
@@ -26,134 +45,541 @@ class CleanCollection:
     def __init__(self, collection):
         self.collection = collection
 
-    def add(self, documents, metadatas, ids):
+    @staticmethod
+    def _clean_metas(metadatas):
+        # 數值保留原型別（section_num 要用 $gte / $lte 篩選），其他轉成字串
         clean_metas = []
         for meta in metadatas:
             clean_metas.append({
-                k: ("" if v is None else str(v)) for k, v in meta.items()
+                k: ("" if v is None else v if isinstance(v, (int, float, bool)) else str(v))
+                for k, v in meta.items()
             })
+        return clean_metas
+
+    def add(self, documents, metadatas, ids, embeddings=None):
         return self.collection.add(
             documents=documents,
-            metadatas=clean_metas,
-            ids=ids
+            metadatas=self._clean_metas(metadatas),
+            ids=ids,
+            embeddings=embeddings
+        )
+
+    def upsert(self, documents, metadatas, ids, embeddings=None):
+        return self.collection.upsert(
+            documents=documents,
+            metadatas=self._clean_metas(metadatas),
+            ids=ids,
+            embeddings=embeddings
         )
 
 
 # ================== XML Parser ==================
+HK_NS = "http://www.xml.gov.hk/schemas/hklm/1.0"
+# 條文內文取自這三種節點（依此順序串接）
+SECTION_TEXT_TAGS = [f"{{{HK_NS}}}{tag}" for tag in ("text", "content", "paragraph")]
+
+
 def parse_xml(file_path):
-    ns = {"hk": "http://www.xml.gov.hk/schemas/hklm/1.0"}
+    ns = {"hk": HK_NS}
     tree = ET.parse(file_path)
     root = tree.getroot()
 
-    cap_number = root.attrib.get("Cap", os.path.basename(file_path))
+    # 優先用 <meta><docNumber>（例如 4A），檔名帶版本日期，會隨每次修訂改變
+    doc_number = root.findtext("hk:meta/hk:docNumber", default="", namespaces=ns).strip()
+    cap_number = doc_number or root.attrib.get("Cap", os.path.basename(file_path))
     law_name_elem = root.find(".//hk:docTitle", ns)
     law_name = law_name_elem.text if law_name_elem is not None else ""
 
     chunks = []
+    seen_ids = set()
 
     for sec in root.findall(".//hk:section", ns):
-        section_id = sec.attrib.get("id", "")
-        heading_elem = sec.find("hk:heading", ns)
-        heading = heading_elem.text if heading_elem is not None else ""
-
-        text_parts = []
-        for tag in ["text", "content", "paragraph"]:
-            for elem in sec.findall(f".//hk:{tag}", ns):
-                txt = "".join(elem.itertext()).strip()
-                if txt:
-                    text_parts.append(txt)
-
-        text = "\n".join(text_parts).strip()
-        if len(text) < 10:
+        chunk = _section_chunk(sec, cap_number, law_name, seen_ids)
+        if chunk:
+            chunks.append(chunk)
+
+    return chunks
+
+
+def iter_xml_sections(file_path):
+    """iterparse 串流模式：每個條文一解析完就 yield，並立即釋放已處理的節點
+
+    與 parse_xml 輸出相同的 chunk，但不會把整棵樹留在記憶體，
+    峰值記憶體只取決於單一條文大小，與檔案大小無關。
+    """
+    section_tag = f"{{{HK_NS}}}section"
+    doc_number_tag = f"{{{HK_NS}}}docNumber"
+    doc_title_tag = f"{{{HK_NS}}}docTitle"
+
+    cap_number = None
+    law_name = None
+    seen_ids = set()
+    stack = []          # 目前開啟中的節點（用來找 parent）
+    open_sections = 0   # 仍未結束的 section 數；條文內的節點要留到條文結束才可釋放
+    sections = []       # 最外層條文內的所有 section（按出現次序，條文可以巢狀）
+
+    for event, elem in ET.iterparse(file_path, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == section_tag:
+                open_sections += 1
+                sections.append(elem)
+                if cap_number is None:
+                    cap_number = stack[0].attrib.get("Cap", os.path.basename(file_path))
             continue
 
-        chunks.append({
-            "cap_number": cap_number,
-            "law_name": law_name,
-            "section": section_id,
-            "hierarchy": heading,
-            "text": text
-        })
+        stack.pop()
+        if elem.tag == doc_number_tag and cap_number is None and len(stack) == 2:
+            # 只接受 <root><meta><docNumber>，與 parse_xml 的 meta/docNumber 一致
+            cap_number = (elem.text or "").strip() or None
+        elif elem.tag == doc_title_tag and law_name is None:
+            law_name = elem.text
+        elif elem.tag == section_tag:
+            open_sections -= 1
+            if open_sections == 0:
+                # 最外層條文結束，按文件次序輸出（與 findall 相同）
+                for sec in sections:
+                    chunk = _section_chunk(sec, cap_number, law_name or "", seen_ids)
+                    if chunk:
+                        yield chunk
+                sections = []
+
+        if open_sections == 0 and stack:
+            stack[-1].remove(elem)
+            elem.clear()
+
+
+def _section_chunk(sec, cap_number, law_name, seen_ids):
+    section_id = sec.attrib.get("id", "")
+    heading_elem = sec.find(f"{{{HK_NS}}}heading")
+    heading = heading_elem.text if heading_elem is not None else ""
+    num_elem = sec.find(f"{{{HK_NS}}}num")
+
+    text = section_text(sec)
+    if len(text) < 10:
+        return None
+
+    return {
+        "id": _stable_id(cap_number, section_id, seen_ids),
+        "cap_number": cap_number,
+        "law_name": law_name,
+        "section": section_id,
+        "section_num": section_number(num_elem.attrib.get("value", "") if num_elem is not None else ""),
+        "hierarchy": heading,
+        "text": text,
+        "content_hash": content_hash(law_name, heading, text)
+    }
 
-    return chunks
+
+def section_number(value):
+    """<num value="2A"> → 2（條號的數字部份，供範圍篩選）；沒有數字時為 None"""
+    match = re.match(r"\d+", value.strip())
+    return int(match.group()) if match else None
+
+
+def section_text(sec):
+    """單次走訪條文子樹，按 text → content → paragraph 的次序收集內文"""
+    parts = {tag: [] for tag in SECTION_TEXT_TAGS}
+    for elem in sec.iter():
+        if elem is not sec and elem.tag in parts:
+            txt = "".join(elem.itertext()).strip()
+            if txt:
+                parts[elem.tag].append(txt)
+    return "\n".join(txt for tag in SECTION_TEXT_TAGS for txt in parts[tag]).strip()
+
+
+def _preview(file_path, chunks, total=None):
+    print(f"\n📖 已解析 {file_path} → {len(chunks) if total is None else total} 個 chunks")
+
+    # Debug: 顯示前 3 條
+    for c in chunks[:3]:
+        print("    --- 條文預覽 ---")
+        print(f"    cap_number: {c['cap_number']}")
+        print(f"    law_name: {c['law_name']}")
+        print(f"    section: {c['section']}")
+        print(f"    hierarchy: {c['hierarchy']}")
+        print(f"    text: {c['text'][:80]}...")
+        print("    ----------------")
+
+
+def xml_cap_number(file_path):
+    """只讀到第一個條文前，取出與 parse_xml 相同的 cap_number"""
+    doc_number_tag = f"{{{HK_NS}}}docNumber"
+    section_tag = f"{{{HK_NS}}}section"
+    root_cap = None
+    depth = 0
+    for event, elem in ET.iterparse(file_path, events=("start", "end")):
+        if event == "start":
+            if depth == 0:
+                root_cap = elem.attrib.get("Cap")
+            depth += 1
+            if elem.tag == section_tag:
+                break
+            continue
+        depth -= 1
+        if elem.tag == doc_number_tag and depth == 2 and (elem.text or "").strip():
+            return elem.text.strip()
+    return root_cap or os.path.basename(file_path)
+
+
+def check_duplicate_caps(file_paths):
+    """同一個 Cap 出現在多個 XML（例如重新下載或不同版本的檔案）時拋出 ValueError
+
+    兩個檔案會產生相同的條文 id，後寫入的會蓋掉先寫入的，清除過時條文時也會以錯誤的內容為準。
+    """
+    files_by_cap = {}
+    for file_path in file_paths:
+        files_by_cap.setdefault(xml_cap_number(file_path), []).append(file_path)
+    duplicates = {cap: paths for cap, paths in files_by_cap.items() if len(paths) > 1}
+    if duplicates:
+        detail = "；".join(f"Cap {cap}: {', '.join(paths)}" for cap, paths in sorted(duplicates.items()))
+        raise ValueError(f"❌ 同一條例有多個 XML 檔，請只保留一個版本：{detail}")
+
+
+def iter_parsed_chunks(file_paths, workers=None, queue_size=256, streaming=False):
+    """解析 XML，經有界 queue 逐條交給 embedding / 寫入階段
+
+    預設用 process pool 平行解析多個檔案；streaming=True 時改為逐檔 iterparse，
+    每個條文一完成就放入 queue，適合超大的條例檔案。
+    解析與 embedding 同時進行；queue 滿時解析端會等待，記憶體不會無限增長。
+    開始前先檢查有沒有同一 Cap 的重複檔案（見 check_duplicate_caps），寫入任何條文前就會失敗。
+    """
+    check_duplicate_caps(file_paths)
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    done = object()
+
+    def produce_parallel():
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for file_path, chunks in zip(file_paths, pool.map(parse_xml, file_paths)):
+                _preview(file_path, chunks)
+                for chunk in chunks:
+                    chunk_queue.put(chunk)
+
+    def produce_streaming():
+        for file_path in file_paths:
+            head, total = [], 0
+            for chunk in iter_xml_sections(file_path):
+                if total < 3:
+                    head.append(chunk)
+                total += 1
+                chunk_queue.put(chunk)
+            _preview(file_path, head, total)
+
+    def produce():
+        try:
+            if streaming:
+                produce_streaming()
+            else:
+                produce_parallel()
+        except Exception as e:
+            chunk_queue.put(e)
+        finally:
+            chunk_queue.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    while True:
+        item = chunk_queue.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def _stable_id(cap_number, section_id, seen_ids):
+    """條文 id 只由 Cap + section id 組成，插入新條文不會令其他 id 位移"""
+    base = f"{cap_number}_{section_id}"
+    chunk_id, n = base, 1
+    while chunk_id in seen_ids:
+        n += 1
+        chunk_id = f"{base}#{n}"
+    seen_ids.add(chunk_id)
+    return chunk_id
+
+
+def content_hash(law_name, heading, text):
+    raw = "\x1f".join([law_name or "", heading or "", text])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 
 # ================== Save to ChromaDB ==================
-def save_to_chroma(chunks, model_name="thenlper/gte-large-zh"):
+def _existing_hashes(raw_collection, page_size=5000):
+    """讀出 collection 內已有的 id → content_hash（分頁讀，避免一次拉全部）
+
+    metadata 缺少目前欄位（例如舊版沒有 section_num）的條文當作已變更，會重新寫入。
+    """
+    hashes = {}
+    offset = 0
+    while True:
+        page = raw_collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for chunk_id, meta in zip(page["ids"], page["metadatas"]):
+            meta = meta or {}
+            hashes[chunk_id] = meta.get("content_hash", "") if META_FIELDS <= meta.keys() else ""
+        if len(page["ids"]) < page_size:
+            return hashes
+        offset += page_size
+
+
+META_FIELDS = {"cap_number", "law_name", "section", "section_num", "hierarchy", "content_hash"}
+
+
+def _chunk_metas(batch):
+    return [{
+        "cap_number": chunk.get("cap_number"),
+        "law_name": chunk.get("law_name"),
+        "section": chunk.get("section"),
+        "section_num": chunk.get("section_num"),
+        "hierarchy": chunk.get("hierarchy"),
+        "content_hash": chunk.get("content_hash")
+    } for chunk in batch]
+
+
+def _write_batch(embedding_fn, collection, batch):
+    documents = [chunk["text"] for chunk in batch]
+    metas = _chunk_metas(batch)
+    ids = [chunk["id"] for chunk in batch]
+
+    # 整批一次 encode，再一次寫入，避免逐條 embedding + commit
+    t0 = time.perf_counter()
+    embeddings = embedding_fn.encode(documents, batch_size=len(batch))
+    t1 = time.perf_counter()
+    collection.upsert(documents=documents, metadatas=metas, ids=ids, embeddings=embeddings)
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+
+def save_to_chroma(chunks, model_name="thenlper/gte-large-zh", batch_size=64, full=False, embedding_fn=None):
+    """chunks 可以是 list 或 iter_parsed_chunks() 的串流；回傳本次看到的全部條文
+
+    embedding_fn 預設為經本地快取的 BGEEmbeddingFunction(model_name)（基準測試可傳入其他實作）。
+    """
+    # 經本地 embedding 快取：重跑入庫時內容相同的條文不會再送進模型
+    embedding_fn = embedding_fn or with_embedding_cache(BGEEmbeddingFunction(model_name))
     client = chromadb.PersistentClient(path="./chroma_db")
     raw_collection = client.get_or_create_collection(
         name="hk_cap4_laws",
-        embedding_function=BGEEmbeddingFunction(model_name)
+        embedding_function=embedding_fn
     )
     collection = CleanCollection(raw_collection)
 
-    print(f"📊 正在儲存 {len(chunks)} 個條文到 ChromaDB ...")
-
-    for i, chunk in enumerate(tqdm(chunks, desc="寫入進度")):
-        meta = {
-            "cap_number": chunk.get("cap_number"),
-            "law_name": chunk.get("law_name"),
-            "section": chunk.get("section"),
-            "hierarchy": chunk.get("hierarchy")
-        }
-
-        collection.add(
-            documents=[chunk["text"]],
-            metadatas=[meta],
-            ids=[f"{meta['cap_number']}_{meta['section']}_{i}"]
-        )
+    # 增量模式：只 embed 新增 / 內容有變的條文，並刪走已不存在的條文
+    existing = _existing_hashes(raw_collection)
 
+    all_chunks = []
+    pending = []
+    embedded = 0
+    embed_seconds = 0.0
+    write_seconds = 0.0
+    for chunk in tqdm(chunks, desc="寫入進度"):
+        all_chunks.append(chunk)
+        if full or existing.get(chunk["id"]) != chunk["content_hash"]:
+            pending.append(chunk)
+        if len(pending) >= batch_size:
+            e_s, w_s = _write_batch(embedding_fn, collection, pending)
+            embedded += len(pending)
+            embed_seconds += e_s
+            write_seconds += w_s
+            pending = []
+    if pending:
+        e_s, w_s = _write_batch(embedding_fn, collection, pending)
+        embedded += len(pending)
+        embed_seconds += e_s
+        write_seconds += w_s
+
+    if not all_chunks:
+        # 沒解析到任何條文時不做刪除，以免清空整個 collection
+        return all_chunks
+
+    current_ids = {c["id"] for c in all_chunks}
+    stale_ids = [chunk_id for chunk_id in existing if chunk_id not in current_ids]
+    for start in range(0, len(stale_ids), batch_size):
+        raw_collection.delete(ids=stale_ids[start:start + batch_size])
+
+    print(f"📊 共 {len(all_chunks)} 個條文：embedding {embedded} 個，"
+          f"未變 {len(all_chunks) - embedded} 個，刪除 {len(stale_ids)} 個（批次大小 {batch_size}）")
+    print(f"⏱️ Embedding：{embedded} 條 / {embed_seconds:.2f}s"
+          f"（{_rate(embedded, embed_seconds)} chunks/s）")
+    print(f"⏱️ 寫入 Chroma：{embedded} 條 / {write_seconds:.2f}s"
+          f"（{_rate(embedded, write_seconds)} chunks/s）")
     print("✅ 儲存完成")
+    return all_chunks
+
+
+# ================== Save to 量化向量庫 ==================
+def save_to_quantized_store(chunks, model_name="thenlper/gte-large-zh", batch_size=64, full=False,
+                            dtype="int8", path="./law_vectors", embedding_fn=None):
+    """與 save_to_chroma 相同的增量入庫，但向量寫到 int8 / float16 量化向量庫（見 quantized_store.py）
+
+    量化向量庫整個重寫：沒變的條文直接沿用舊庫的 float32 向量，不會重新 embedding。
+    """
+    embedding_fn = embedding_fn or with_embedding_cache(BGEEmbeddingFunction(model_name))
+    old = None
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            old = QuantizedVectorStore.load(path)
+        except Exception as e:
+            print(f"⚠️ 無法讀取舊量化向量庫，將全部重新 embedding: {e}")
+    if old and old.meta.get("model") != model_name:
+        print(f"⚠️ 舊量化向量庫由 {old.meta.get('model')} 產生，全部重新 embedding")
+        old.close()
+        old = None
+    existing = old.content_hashes() if old else {}
+    old_rows = {r["id"]: i for i, r in old.iter_rows()} if old else {}
+    writer = QuantizedStoreWriter(path, dtype=dtype, model_name=model_name)
+
+    def flush(batch):
+        documents = [chunk["text"] for chunk in batch]
+        t0 = time.perf_counter()
+        embeddings = embedding_fn.encode(documents, batch_size=len(batch))
+        t1 = time.perf_counter()
+        writer.add([chunk["id"] for chunk in batch], documents, _chunk_metas(batch), embeddings)
+        return t1 - t0, time.perf_counter() - t1
+
+    all_chunks = []
+    pending = []
+    embedded = 0
+    embed_seconds = 0.0
+    write_seconds = 0.0
+    for chunk in tqdm(chunks, desc="寫入進度"):
+        all_chunks.append(chunk)
+        if full or existing.get(chunk["id"]) != chunk["content_hash"]:
+            pending.append(chunk)
+        else:
+            row = old_rows[chunk["id"]]
+            writer.add([chunk["id"]], [chunk["text"]], _chunk_metas([chunk]), old.full[row:row + 1])
+        if len(pending) >= batch_size:
+            e_s, w_s = flush(pending)
+            embedded += len(pending)
+            embed_seconds += e_s
+            write_seconds += w_s
+            pending = []
+    if pending:
+        e_s, w_s = flush(pending)
+        embedded += len(pending)
+        embed_seconds += e_s
+        write_seconds += w_s
+
+    if old:
+        old.close()
+    if not all_chunks:
+        # 沒解析到任何條文時保留舊的向量庫
+        shutil.rmtree(writer.tmp_path, ignore_errors=True)
+        return all_chunks
+    writer.finish()
+
+    # 新庫只含本次的條文，已刪除的條文自然不會留下
+    current_ids = {c["id"] for c in all_chunks}
+    stale = sum(1 for chunk_id in existing if chunk_id not in current_ids)
+    store = QuantizedVectorStore.load(path)
+    print(f"📊 共 {len(all_chunks)} 個條文：embedding {embedded} 個，"
+          f"未變 {len(all_chunks) - embedded} 個，刪除 {stale} 個（批次大小 {batch_size}）")
+    print(f"⏱️ Embedding：{embedded} 條 / {embed_seconds:.2f}s"
+          f"（{_rate(embedded, embed_seconds)} chunks/s）")
+    print(f"💾 {dtype} 量化向量：{store.memory_bytes() / 1024 ** 2:.1f} MB 常駐記憶體"
+          f"（float32 為 {store.full.nbytes / 1024 ** 2:.1f} MB，只在重算分數時從磁碟讀取）")
+    store.close()
+    print(f"✅ 量化向量庫已儲存到 {path}/")
+    return all_chunks
+
+
+def _rate(count, seconds):
+    return f"{count / seconds:.1f}" if seconds > 0 else "∞"
 
 # ================== Save BM25 ==================
-def save_bm25_index(chunks, save_path="bm25_index.pkl"):
+def _load_previous_tokens(save_path, signature):
+    """沿用上一次索引的斷詞結果（以 content_hash 對應），只為新 / 改動的條文跑 jieba"""
+    if not os.path.exists(save_path):
+        return {}
+    try:
+        old = BM25Index.load(save_path)
+        if old.tokenizer != signature:
+            print("⚠️ 斷詞設定（jieba 版本 / 法律詞典）已改變，全部重新斷詞")
+            old.close()
+            return {}
+        previous = {
+            chunk.get("content_hash"): chunk["tokens"]
+            for chunk in old.iter_docs(with_tokens=True)
+            if chunk.get("content_hash")
+        }
+        old.close()
+        return previous
+    except Exception as e:
+        print(f"⚠️ 無法讀取舊 BM25 索引，將全部重新斷詞: {e}")
+        return {}
+
+
+def save_bm25_index(chunks, save_path="bm25_index", workers=None):
     if not chunks:
         print("⚠️ 沒有條文，BM25 索引不會建立")
         return
 
     print("📦 正在建立 BM25 索引 ...")
-    tokenized_corpus = [list(jieba.cut(chunk["text"])) for chunk in chunks]
-    bm25 = BM25Okapi(tokenized_corpus)
+    signature = tokenizer_signature()
+    previous = _load_previous_tokens(save_path, signature)
+    tokenized_corpus = [previous.get(chunk["content_hash"]) for chunk in chunks]
+    missing = [i for i, tokens in enumerate(tokenized_corpus) if tokens is None]
 
-    data = {
-        "bm25": bm25,
-        "chunks": chunks
-    }
+    # 未能沿用的條文分給多個 process 平行斷詞
+    t0 = time.perf_counter()
+    for i, tokens in zip(missing, tokenize_corpus([chunks[i]["text"] for i in missing], workers=workers)):
+        tokenized_corpus[i] = tokens
+    seconds = time.perf_counter() - t0
+    print(f"  → 沿用 {len(chunks) - len(missing)} 個條文的斷詞，重新斷詞 {len(missing)} 個"
+          f"（{seconds:.2f}s，{_rate(len(missing), seconds)} chunks/s）")
 
-    with open(save_path, "wb") as f:
-        pickle.dump(data, f)
+    # 索引只由本次的條文建立，已刪除的條文自然不會留在 BM25 裡
+    BM25Index.build(tokenized_corpus, chunks, tokenizer=signature).save(save_path)
 
-    print(f"✅ BM25 索引已儲存到 {save_path}")
+    print(f"✅ BM25 索引已儲存到 {save_path}/")
 
 
 # ================== Main ==================
 if __name__ == "__main__":
-    laws_dir = "./laws"
-    all_chunks = []
-
-    for file_name in os.listdir(laws_dir):
-        if not file_name.endswith(".xml"):
-            continue
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=64, help="每批 embedding + 寫入的條文數")
+    parser.add_argument("--full", action="store_true", help="忽略 content hash，全部條文重新 embedding")
+    parser.add_argument("--parse-workers", type=int, default=None, help="解析 XML 的 process 數（預設為 CPU 核心數）")
+    parser.add_argument("--queue-size", type=int, default=256, help="解析與 embedding 之間的緩衝條文數")
+    parser.add_argument("--tokenize-workers", type=int, default=None, help="BM25 斷詞的 process 數（預設為 CPU 核心數）")
+    parser.add_argument("--stream-xml", action="store_true", help="以 iterparse 串流解析（超大 XML 用，不必把整棵 XML 樹載入記憶體）")
+    parser.add_argument("--embedding-backend", choices=BACKENDS, default=None,
+                        help="embedding 推論方式（預設讀環境變數 EMBEDDING_BACKEND，否則 torch）")
+    parser.add_argument("--embed-workers", type=int, default=None,
+                        help="embedding 的 process 數（每個各載入一份模型；預設只用本 process）")
+    parser.add_argument("--embed-threads", type=int, default=None,
+                        help="每個 embedding process 的執行緒數（預設為 CPU 核心數 / process 數）")
+    parser.add_argument("--quantize", choices=QUANT_DTYPES, default=None,
+                        help="向量改存到 ./law_vectors 量化向量庫（int8 / float16），不寫入 Chroma")
+    args = parser.parse_args()
 
-        file_path = os.path.join(laws_dir, file_name)
-        print(f"\n📖 正在解析 {file_path} ...")
-        chunks = parse_xml(file_path)
-        print(f"  → 解析到 {len(chunks)} 個 chunks")
-
-        # Debug: 顯示前 3 條
-        for c in chunks[:3]:
-            print("    --- 條文預覽 ---")
-            print(f"    cap_number: {c['cap_number']}")
-            print(f"    law_name: {c['law_name']}")
-            print(f"    section: {c['section']}")
-            print(f"    hierarchy: {c['hierarchy']}")
-            print(f"    text: {c['text'][:80]}...")
-            print("    ----------------")
+    laws_dir = "./laws"
+    file_paths = sorted(
+        os.path.join(laws_dir, file_name)
+        for file_name in os.listdir(laws_dir)
+        if file_name.endswith(".xml")
+    )
 
-        all_chunks.extend(chunks)
+    chunk_stream = iter_parsed_chunks(file_paths, workers=args.parse_workers, queue_size=args.queue_size,
+                                      streaming=args.stream_xml)
+    batch_size = args.batch_size
+    if args.embed_workers and args.embed_workers > 1 and batch_size < args.embed_workers * 16:
+        # 每批會切給所有 worker，批次太小時大部分 worker 會閒著
+        batch_size = args.embed_workers * 16
+        print(f"ℹ️ 多 process embedding：批次大小調高為 {batch_size}")
+    embedding_fn = with_embedding_cache(BGEEmbeddingFunction("thenlper/gte-large-zh",  # 👈 改成 gte-large-zh
+                                                             backend=args.embedding_backend,
+                                                             workers=args.embed_workers,
+                                                             threads_per_worker=args.embed_threads))
+    if args.quantize:
+        all_chunks = save_to_quantized_store(chunk_stream, model_name="thenlper/gte-large-zh",
+                                             batch_size=batch_size, full=args.full, dtype=args.quantize,
+                                             embedding_fn=embedding_fn)
+    else:
+        all_chunks = save_to_chroma(chunk_stream, model_name="thenlper/gte-large-zh",
+                                    batch_size=batch_size, full=args.full, embedding_fn=embedding_fn)
 
     if all_chunks:
-        save_to_chroma(all_chunks, model_name="thenlper/gte-large-zh")  # 👈 改成 gte-large-zh
-        save_bm25_index(all_chunks, "bm25_index.pkl")
+        save_bm25_index(all_chunks, "bm25_index", workers=args.tokenize_workers)
     else:
         print("⚠️ 沒有解析到任何條文！")
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import chromadb
+from faiss_store import INDEX_KINDS, FaissVectorStore, export_chroma, write_store
+
+# ================== FAISS vs Chroma 基準測試 ==================
+# 以 float32 暴力搜尋的結果為標準答案，比較 Chroma（HNSW, cosine）與 FAISS（hnsw / ivfpq）的
+# recall@k、查詢延遲（平均 / p95，含讀取條文與 metadata）、建立時間，以及 FAISS 載入後增加的常駐記憶體（RSS，只有 Linux）。
+#   - 向量取自現有的 hk_cap4_laws collection，不需 embedding 模型
+#   - --scale N 以現有向量加雜訊擴充到 N 個，模擬整部法例匯編的規模
+#   - 查詢為抽樣向量加雜訊
+# Chroma 與 FAISS 都在暫存目錄重新建立，不碰 ./chroma_db 的內容。
+#
+# 用法：python bench_faiss.py --scale 300000 --queries 200 --k 10 --output bench_faiss.json
+
+
+def scale_up(vectors, documents, metadatas, target, noise, seed):
+    """以加雜訊的複本把語料擴充到 target 個向量"""
+    if target <= len(vectors):
+        return vectors, documents, metadatas
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=target - len(vectors))
+    extra = vectors[picks] + noise * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    return (np.vstack([vectors, extra]),
+            documents + [documents[i] for i in picks],
+            metadatas + [metadatas[i] for i in picks])
+
+
+def rss_mb():
+    """目前 process 的常駐記憶體（MB）；沒有 /proc 時回傳 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return None
+
+
+def exact_top_k(vectors, queries, k, block=65536):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = []
+    for q in queries:
+        scores = np.concatenate([normed[s:s + block] @ q for s in range(0, len(normed), block)])
+        truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    return truth
+
+
+def bench_queries(query_fn, queries, truth, k, row_of):
+    latencies, hits = [], 0
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        result = query_fn(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(expected & {row_of[i] for i in result["ids"][0]})
+    return {
+        "recall": round(hits / (k * len(queries)), 4),
+        "latency_ms": round(float(np.mean(latencies)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chroma-path", default="./chroma_db")
+    parser.add_argument("--scale", type=int, default=0, help="擴充到的向量數（預設用現有語料大小）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--kinds", nargs="+", choices=INDEX_KINDS, default=list(INDEX_KINDS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="結果 JSON 輸出檔（預設印到 stdout）")
+    args = parser.parse_args()
+
+    ids, documents, metadatas, vectors = export_chroma(args.chroma_path)
+    vectors, documents, metadatas = scale_up(vectors, documents, metadatas, args.scale, args.noise, args.seed)
+    ids = [f"v{i}" for i in range(len(vectors))]   # 擴充後的複本需要唯一 id
+    row_of = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + args.noise * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"📦 {len(vectors)} 個向量 × {vectors.shape[1]} 維，{len(queries)} 個查詢，k={args.k}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        client = chromadb.PersistentClient(path=os.path.join(tmp, "chroma"))
+        collection = client.create_collection(name="bench", metadata={"hnsw:space": "cosine"},
+                                              embedding_function=None)
+        for s in range(0, len(ids), 5000):
+            collection.add(ids=ids[s:s + 5000], documents=documents[s:s + 5000],
+                           metadatas=metadatas[s:s + 5000], embeddings=vectors[s:s + 5000])
+        build_s = time.perf_counter() - t0
+        stats = bench_queries(
+            lambda q: collection.query(query_embeddings=[q.tolist()], n_results=args.k,
+                                       include=["documents", "metadatas", "distances"]),
+            queries, truth, args.k, row_of)
+        results.append({"backend": "chroma", "build_s": round(build_s, 2), **stats})
+
+        for kind in args.kinds:
+            path = os.path.join(tmp, f"faiss_{kind}")
+            t0 = time.perf_counter()
+            write_store(path, ids, documents, metadatas, vectors, kind=kind)
+            build_s = time.perf_counter() - t0
+            rss_before = rss_mb()
+            store = FaissVectorStore.load(path)
+            load_rss_mb = None if rss_before is None else round(rss_mb() - rss_before, 1)
+            stats = bench_queries(lambda q: store.query(query_embeddings=[q], n_results=args.k),
+                                  queries, truth, args.k, row_of)
+            index_mb = os.path.getsize(os.path.join(path, "index.faiss")) / 1024 ** 2
+            store.close()
+            results.append({"backend": f"faiss-{kind}", "build_s": round(build_s, 2),
+                            "index_mb": round(index_mb, 1), "load_rss_mb": load_rss_mb, **stats})
+
+    print(f"{'backend':<12} {'recall@' + str(args.k):>10} {'平均 ms':>9} {'p95 ms':>9} {'建立 s':>8} {'載入 RSS MB':>12}")
+    for r in results:
+        load_rss = "-" if r.get("load_rss_mb") is None else f"{r['load_rss_mb']:.1f}"
+        print(f"{r['backend']:<12} {r['recall']:>10.4f} {r['latency_ms']:>9.3f} {r['p95_ms']:>9.3f} "
+              f"{r['build_s']:>8.1f} {load_rss:>12}")
+
+    report = {"n_vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k,
+              "n_queries": len(queries), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果已寫入 {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib.util
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import resource   # 只有 Unix 有；Windows 上不回報 RSS
+except ImportError:
+    resource = None
+
+# ================== 入庫分階段基準測試 ==================
+# 分別計時 batch_cap4_1.0.py 的各個階段：
+#   parse            parse_xml（逐個檔案，單一 process）
+#   parse_streaming  iter_xml_sections（iterparse 串流）
+#   tokenize         tokenize_corpus（jieba 平行斷詞）
+#   embed            embedding function encode（按 --batch-size 分批）
+#   save_to_chroma   embedding + 寫入 Chroma（全新的暫存資料庫）
+#   save_bm25_index  斷詞 + 建立並儲存 BM25 索引
+# 每個階段回報 wall time、chunks/s 與 Python 配置的記憶體峰值（tracemalloc），
+# 輸出 JSON 方便跨版本比較。斷詞的子 process 與 PyTorch 的原生記憶體不在 tracemalloc 統計內，
+# 另附整個 process 的 RSS 高水位（只會上升，僅供參考）。
+#
+# 用法（離線 / CPU）：
+#   python bench_ingest.py --model stub --output bench_ingest.json
+#   python bench_ingest.py --model BAAI/bge-small-zh-v1.5 --stages parse tokenize embed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = ["parse", "parse_streaming", "tokenize", "embed", "save_to_chroma", "save_bm25_index"]
+
+
+def load_batch_module():
+    """batch_cap4_1.0.py 的檔名不能直接 import，以 importlib 載入"""
+    sys.path.insert(0, HERE)
+    spec = importlib.util.spec_from_file_location("batch_cap4", os.path.join(HERE, "batch_cap4_1.0.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StubEmbeddingFunction:
+    """不需模型的假 embedding：由文字 hash 產生固定的向量，只用來量其他階段的開銷"""
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+        self.model_name = f"stub-{dim}"
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return self.encode(input)
+
+    def encode(self, texts: list[str], batch_size=32) -> list[list[float]]:
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors.append(np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32))
+        return np.asarray(vectors).tolist()
+
+    def name(self) -> str:
+        return self.model_name
+
+
+def _rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024   # macOS 單位是 bytes，Linux 是 KB
+
+
+@contextmanager
+def measure(results, stage, track_memory=True):
+    """量測一個階段；with 區塊內把處理的條文數寫到 record["items"]"""
+    record = {"stage": stage, "items": 0}
+    if track_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        yield record
+    finally:
+        wall = time.perf_counter() - t0
+        record["wall_s"] = round(wall, 4)
+        record["items_per_s"] = round(record["items"] / wall, 2) if wall > 0 else None
+        if track_memory:
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+            tracemalloc.stop()
+        rss = _rss_mb()
+        record["rss_high_water_mb"] = round(rss, 1) if rss is not None else None
+        results.append(record)
+        print(f"⏱️ {stage:<16} {record['items']:>6} 條 / {wall:.2f}s"
+              f"（{record['items_per_s']} chunks/s，峰值 {record.get('peak_mb', '-')} MB）")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--laws-dir", default=os.path.join(HERE, "laws"), help="法律 XML 目錄（預設 rag1.0/laws）")
+    parser.add_argument("--model", default="stub",
+                        help="stub = 假 embedding（離線）；其他值當作 SentenceTransformer 模型名稱")
+    parser.add_argument("--embedding-backend", default=None, help="torch / onnx / onnx-int8（非 stub 模型時）")
+    parser.add_argument("--embed-workers", type=int, default=None, help="多 process embedding 的 worker 數（非 stub 模型時）")
+    parser.add_argument("--stub-dim", type=int, default=1024, help="假 embedding 的維度（gte-large-zh 為 1024）")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--tokenize-workers", type=int, default=None)
+    parser.add_argument("--no-memory", action="store_true", help="不用 tracemalloc（它本身會拖慢執行）")
+    parser.add_argument("--output", default=None, help="結果 JSON 輸出檔（預設印到 stdout）")
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_CACHE_PATH"] = "off"   # 量的是真正的 embedding，不經快取
+    batch = load_batch_module()
+    from legal_tokenizer import init_jieba, tokenize_corpus
+
+    file_paths = sorted(
+        os.path.join(args.laws_dir, name) for name in os.listdir(args.laws_dir) if name.endswith(".xml")
+    )
+    track = not args.no_memory
+    results = []
+
+    # 解析結果是其他階段的輸入，即使沒選 parse 也要先跑
+    chunks = []
+    if "parse" in args.stages:
+        with measure(results, "parse", track) as rec:
+            for path in file_paths:
+                chunks.extend(batch.parse_xml(path))
+            rec["items"] = len(chunks)
+    else:
+        for path in file_paths:
+            chunks.extend(batch.parse_xml(path))
+    texts = [chunk["text"] for chunk in chunks]
+
+    if "parse_streaming" in args.stages:
+        with measure(results, "parse_streaming", track) as rec:
+            rec["items"] = sum(1 for path in file_paths for _ in batch.iter_xml_sections(path))
+
+    if "tokenize" in args.stages:
+        init_jieba()   # 詞典載入不算在斷詞吞吐量內
+        with measure(results, "tokenize", track) as rec:
+            rec["items"] = len(tokenize_corpus(texts, workers=args.tokenize_workers))
+
+    embedding_fn = None
+    if {"embed", "save_to_chroma"} & set(args.stages):
+        if args.model == "stub":
+            embedding_fn = StubEmbeddingFunction(args.stub_dim)
+        else:
+            embedding_fn = batch.BGEEmbeddingFunction(args.model, backend=args.embedding_backend,
+                                                      workers=args.embed_workers)
+
+    if "embed" in args.stages:
+        with measure(results, "embed", track) as rec:
+            for start in range(0, len(texts), args.batch_size):
+                part = texts[start:start + args.batch_size]
+                embedding_fn.encode(part, batch_size=len(part))
+                rec["items"] += len(part)
+
+    # 寫入階段在暫存目錄進行（./chroma_db、bm25_index 都是相對路徑），不碰正式資料
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            if "save_to_chroma" in args.stages:
+                with measure(results, "save_to_chroma", track) as rec:
+                    rec["items"] = len(batch.save_to_chroma(chunks, batch_size=args.batch_size,
+                                                            full=True, embedding_fn=embedding_fn))
+            if "save_bm25_index" in args.stages:
+                with measure(results, "save_bm25_index", track) as rec:
+                    batch.save_bm25_index(chunks, "bm25_index", workers=args.tokenize_workers)
+                    rec["items"] = len(chunks)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": args.model if args.model != "stub" else f"stub-{args.stub_dim}",
+        "embedding_backend": getattr(embedding_fn, "backend", None),
+        "embed_workers": args.embed_workers,
+        "batch_size": args.batch_size,
+        "files": [os.path.basename(p) for p in file_paths],
+        "n_chunks": len(chunks),
+        "stages": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"✅ 結果已寫入 {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
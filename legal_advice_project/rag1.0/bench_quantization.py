@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+from quantized_store import QUANT_DTYPES, QuantizedVectorStore, QuantizedStoreWriter
+
+# ================== 量化向量 recall / 記憶體基準測試 ==================
+# 以 float32 暴力搜尋的結果為標準答案，比較 int8 / float16（有 / 沒有 float32 重算）的
+# recall@k、常駐記憶體與查詢延遲。
+# 向量來源：
+#   --store ./law_vectors   使用已入庫的法律條文向量（batch_cap4_1.0.py --quantize 產生）
+#   --synthetic N D         隨機向量（不需模型，只看相對數字）
+# 查詢以隨機抽樣的條文向量加上雜訊代替，不需載入 embedding 模型。
+#
+# 用法：python bench_quantization.py --store ./law_vectors --k 10 --queries 200 --output bench.json
+
+
+def load_vectors(args):
+    if args.synthetic:
+        n, dim = args.synthetic
+        rng = np.random.default_rng(args.seed)
+        return rng.standard_normal((n, dim)).astype(np.float32)
+    store = QuantizedVectorStore.load(args.store)
+    vectors = np.asarray(store.full, dtype=np.float32)
+    store.close()
+    return vectors
+
+
+def make_queries(vectors, n_queries, noise, seed):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + noise * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors, queries, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    t0 = time.perf_counter()
+    truth = []
+    for q in queries:
+        scores = normed @ q
+        top = np.argpartition(-scores, k - 1)[:k]
+        truth.append(set(top[np.argsort(-scores[top])].tolist()))
+    latency = (time.perf_counter() - t0) / len(queries)
+    return truth, latency, normed.nbytes
+
+
+def bench_store(store, queries, truth, k, rescore):
+    hits = 0
+    t0 = time.perf_counter()
+    for q, expected in zip(queries, truth):
+        rows, _ = store.search(q, n_results=k, rescore=rescore)
+        hits += len(expected & set(rows.tolist()))
+    latency = (time.perf_counter() - t0) / len(queries)
+    return hits / (k * len(queries)), latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default="./law_vectors", help="量化向量庫目錄")
+    parser.add_argument("--synthetic", type=int, nargs=2, metavar=("N", "D"), help="改用 N 個 D 維隨機向量")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="查詢向量相對條文向量的雜訊強度")
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="結果 JSON 輸出檔（預設只印出）")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    k = min(args.k, len(vectors))
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+    truth, exact_latency, exact_bytes = exact_top_k(vectors, queries, k)
+    print(f"📦 {len(vectors)} 個向量 × {vectors.shape[1]} 維，{len(queries)} 個查詢，k={k}")
+
+    results = [{"dtype": "float32", "rescore_factor": None, "recall": 1.0,
+                "memory_mb": exact_bytes / 1024 ** 2, "latency_ms": exact_latency * 1000}]
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in QUANT_DTYPES:
+            path = os.path.join(tmp, dtype)
+            writer = QuantizedStoreWriter(path, dtype=dtype)
+            writer.add([str(i) for i in range(len(vectors))], [""] * len(vectors), [{}] * len(vectors), vectors)
+            writer.finish()
+            store = QuantizedVectorStore.load(path)
+            memory_mb = store.memory_bytes() / 1024 ** 2
+
+            recall, latency = bench_store(store, queries, truth, k, rescore=False)
+            results.append({"dtype": dtype, "rescore_factor": None, "recall": recall,
+                            "memory_mb": memory_mb, "latency_ms": latency * 1000})
+            for factor in args.rescore_factors:
+                store.rescore_factor = factor
+                recall, latency = bench_store(store, queries, truth, k, rescore=True)
+                results.append({"dtype": dtype, "rescore_factor": factor, "recall": recall,
+                                "memory_mb": memory_mb, "latency_ms": latency * 1000})
+            store.close()
+
+    print(f"{'dtype':<8} {'rescore':>8} {'recall@' + str(k):>10} {'記憶體 MB':>10} {'延遲 ms':>9}")
+    for r in results:
+        rescore = f"×{r['rescore_factor']}" if r["rescore_factor"] else "-"
+        print(f"{r['dtype']:<8} {rescore:>8} {r['recall']:>10.4f} {r['memory_mb']:>10.2f} {r['latency_ms']:>9.3f}")
+
+    report = {"n_vectors": len(vectors), "dim": int(vectors.shape[1]), "k": k,
+              "n_queries": len(queries), "noise": args.noise, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os
+import json
+import mmap
+import shutil
+import numpy as np
+
+# ================== BM25 倒排索引 ==================
+# 取代 pickle 整個 rank_bm25.BM25Okapi：
+#   - postings 以 numpy 陣列存放（doc_ids / tfs / offsets），載入時 mmap，不用反序列化
+#   - IDF、文件長度正規化預先計算
+#   - 查詢只掃描 query 詞的 postings，直接回傳 top-k
+# 評分公式與 rank_bm25.BM25Okapi 相同（包括負 IDF 以 epsilon * 平均 IDF 取代）。
+#
+# 按 Cap / 條號篩選：
+#   - 每個 Cap 記錄其文件佔用的 doc id 區間（同一條例的條文是連續入庫的，通常只有一段）；
+#     每個詞的 postings 按 doc id 遞增，以二分搜尋只取落在這些區間內的部份，不掃描其他條例
+#   - section_nums.npy 為每個文件的條號（沒有時 -1），條號範圍在累計分數後才篩
+# 舊的索引沒有這些資料時，第一次篩選會從 docs.jsonl 讀一次補上。
+#
+# 目錄格式：
+#   meta.json        k1 / b / avgdl / 文件數 / 斷詞設定指紋
+#   vocab.json       詞 → term id
+#   idf.npy          float32[V]
+#   offsets.npy      int64[V+1]，term t 的 postings 位於 [offsets[t], offsets[t+1])
+#   doc_ids.npy      int32[P]
+#   tfs.npy          float32[P]
+#   doc_norms.npy    float32[N]，k1 * (1 - b + b * dl / avgdl)
+#   docs.jsonl       每行一個 chunk（含斷詞結果），按需讀取
+#   doc_offsets.npy  int64[N+1]，docs.jsonl 的位元組位移
+#   section_nums.npy int32[N]，條號（沒有時 -1）
+#   meta.json 的 cap_ranges：Cap → [[起, 訖), ...] doc id 區間
+
+FORMAT_VERSION = 1
+
+
+class BM25Index:
+    def __init__(self, vocab, idf, offsets, doc_ids, tfs, doc_norms, k1, b, avgdl,
+                 docs_path=None, docs=None, doc_offsets=None, tokenizer=None, cap_ranges=None, section_nums=None):
+        self.vocab = vocab
+        self.idf = idf
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_norms = doc_norms
+        self.k1 = k1
+        self.b = b
+        self.avgdl = avgdl
+        self.tokenizer = tokenizer
+        self._docs = docs
+        self._docs_path = docs_path
+        self._doc_offsets = doc_offsets
+        self._docs_mmap = None
+        self._cap_ranges = cap_ranges
+        self._section_nums = section_nums
+
+    def __len__(self):
+        return len(self.doc_norms)
+
+    # ---------- 建立 ----------
+    @classmethod
+    def build(cls, tokenized_corpus, chunks, k1=1.5, b=0.75, epsilon=0.25, tokenizer=None):
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lens = np.zeros(len(tokenized_corpus), dtype=np.float32)
+        for doc_id, tokens in enumerate(tokenized_corpus):
+            doc_lens[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")   # 同一詞內保持 doc_id 遞增
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        tfs = np.asarray(tfs, dtype=np.float32)[order]
+        df = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        n_docs = len(tokenized_corpus)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+        avgdl = float(doc_lens.mean()) if n_docs else 0.0
+        doc_norms = k1 * (1 - b + b * doc_lens / avgdl) if avgdl else np.full(n_docs, k1, dtype=np.float32)
+
+        docs = [dict(chunk, tokens=list(tokens)) for chunk, tokens in zip(chunks, tokenized_corpus)]
+        cap_ranges, section_nums = _filter_columns(docs)
+        return cls(vocab, idf.astype(np.float32), offsets, doc_ids, tfs,
+                   doc_norms.astype(np.float32), k1, b, avgdl, docs=docs, tokenizer=tokenizer,
+                   cap_ranges=cap_ranges, section_nums=section_nums)
+
+    # ---------- 儲存 / 載入 ----------
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        doc_offsets = [0]
+        with open(os.path.join(tmp_path, "docs.jsonl"), "wb") as f:
+            for i in range(len(self)):
+                line = (json.dumps(self.doc(i, with_tokens=True), ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                doc_offsets.append(doc_offsets[-1] + len(line))
+
+        arrays = {
+            "idf": self.idf, "offsets": self.offsets, "doc_ids": self.doc_ids,
+            "tfs": self.tfs, "doc_norms": self.doc_norms,
+            "doc_offsets": np.asarray(doc_offsets, dtype=np.int64),
+            "section_nums": self.section_nums(),
+        }
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(arr))
+        with open(os.path.join(tmp_path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": FORMAT_VERSION, "k1": self.k1, "b": self.b,
+                       "avgdl": self.avgdl, "n_docs": len(self), "tokenizer": self.tokenizer,
+                       "cap_ranges": {cap: r.tolist() for cap, r in self.cap_ranges().items()}}, f)
+
+        # 先寫到暫存目錄，完成後才換掉舊索引，避免讀到寫了一半的檔案
+        self.close()
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"❌ 不支援的 BM25 索引格式: {meta.get('format')}，請重新執行 batch_cap4_1.0.py")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+
+        def arr(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        cap_ranges = meta.get("cap_ranges")
+        if cap_ranges is not None:
+            cap_ranges = {cap: np.asarray(r, dtype=np.int64).reshape(-1, 2) for cap, r in cap_ranges.items()}
+        has_sections = os.path.exists(os.path.join(path, "section_nums.npy"))
+        return cls(vocab, arr("idf"), arr("offsets"), arr("doc_ids"), arr("tfs"), arr("doc_norms"),
+                   meta["k1"], meta["b"], meta["avgdl"],
+                   docs_path=os.path.join(path, "docs.jsonl"), doc_offsets=arr("doc_offsets"),
+                   tokenizer=meta.get("tokenizer"), cap_ranges=cap_ranges,
+                   section_nums=arr("section_nums") if has_sections else None)
+
+    def close(self):
+        if self._docs_mmap is not None:
+            self._docs_mmap.close()
+            self._docs_mmap = None
+
+    # ---------- 文件 ----------
+    def doc(self, i, with_tokens=False):
+        """第 i 個 chunk（dict）；載入的索引按需從 docs.jsonl 讀取"""
+        if self._docs is not None:
+            chunk = dict(self._docs[i])
+        else:
+            if self._docs_mmap is None:
+                with open(self._docs_path, "rb") as f:
+                    self._docs_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            start, end = int(self._doc_offsets[i]), int(self._doc_offsets[i + 1])
+            chunk = json.loads(self._docs_mmap[start:end].decode("utf-8"))
+        if not with_tokens:
+            chunk.pop("tokens", None)
+        return chunk
+
+    def iter_docs(self, with_tokens=False):
+        for i in range(len(self)):
+            yield self.doc(i, with_tokens=with_tokens)
+
+    # ---------- 篩選用的欄位 ----------
+    def _load_filter_columns(self):
+        self._cap_ranges, self._section_nums = _filter_columns(self.iter_docs())
+
+    def cap_ranges(self):
+        """Cap → int64[r, 2] 的 doc id 區間 [起, 訖)"""
+        if self._cap_ranges is None:
+            self._load_filter_columns()
+        return self._cap_ranges
+
+    def section_nums(self):
+        if self._section_nums is None:
+            self._load_filter_columns()
+        return self._section_nums
+
+    def caps(self):
+        """索引內所有的 Cap 編號（按入庫次序）"""
+        return list(self.cap_ranges())
+
+    # ---------- 查詢 ----------
+    def _spans(self, term_id, ranges):
+        """term 的 postings 位置；有 doc id 區間時以二分搜尋只取區間內的部份"""
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        if ranges is None:
+            return [(start, end)]
+        postings = self.doc_ids[start:end]
+        lo = np.searchsorted(postings, ranges[:, 0])
+        hi = np.searchsorted(postings, ranges[:, 1])
+        return [(start + int(a), start + int(b)) for a, b in zip(lo, hi) if b > a]
+
+    def _accumulate(self, query_tokens, ranges=None):
+        """回傳 (候選 doc ids, 對應分數)；只觸及 query 詞的 postings（ranges 內的部份）"""
+        touched = []
+        contribs = []
+        for token in query_tokens:   # 重複詞會重複計分，與 BM25Okapi 一致
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            for start, end in self._spans(term_id, ranges):
+                docs = self.doc_ids[start:end]
+                tf = self.tfs[start:end]
+                touched.append(docs)
+                contribs.append(self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.doc_norms[docs]))
+        if not touched:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        docs = np.concatenate(touched)
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        np.add.at(scores, inverse, np.concatenate(contribs))
+        return candidates, scores
+
+    def get_scores(self, query_tokens):
+        """與 BM25Okapi.get_scores 相同：回傳所有文件的分數陣列"""
+        scores = np.zeros(len(self), dtype=np.float64)
+        candidates, cand_scores = self._accumulate(query_tokens)
+        scores[candidates] = cand_scores
+        return scores
+
+    def top_k(self, query_tokens, k=10, caps=None, sections=None):
+        """回傳 [(doc_idx, score), ...]，分數由高到低；只包含至少命中一個詞的文件
+
+        caps：只在這些 Cap 內搜尋；sections：(起, 訖) 條號範圍，含兩端，任一端可為 None。
+        """
+        ranges = None
+        if caps:
+            cap_ranges = self.cap_ranges()
+            found = [cap_ranges[str(c)] for c in caps if str(c) in cap_ranges]
+            if not found:
+                return []
+            ranges = np.vstack(found)
+        candidates, scores = self._accumulate(query_tokens, ranges)
+        if sections and len(candidates):
+            nums = np.asarray(self.section_nums())[candidates]
+            lo, hi = sections
+            keep = nums >= 0
+            if lo is not None:
+                keep &= nums >= int(lo)
+            if hi is not None:
+                keep &= nums <= int(hi)
+            candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+
+def _filter_columns(docs):
+    """由 chunk dicts 算出 (Cap → doc id 區間, 條號陣列)"""
+    cap_ranges = {}
+    section_nums = []
+    prev_cap = None
+    for i, doc in enumerate(docs):
+        cap = str(doc.get("cap_number") or "")
+        if cap != prev_cap:
+            cap_ranges.setdefault(cap, []).append([i, i + 1])
+            prev_cap = cap
+        else:
+            cap_ranges[cap][-1][1] = i + 1
+        num = doc.get("section_num")
+        section_nums.append(-1 if num in (None, "") else int(num))
+    return ({cap: np.asarray(r, dtype=np.int64) for cap, r in cap_ranges.items()},
+            np.asarray(section_nums, dtype=np.int32))
@@ -3,16 +3,25 @@ import re
 import pdfplumber
 import docx
 import chromadb
-from sentence_transformers import SentenceTransformer
+from embedding_cache import with_embedding_cache
+from onnx_embedding import resolve_backend
+from model_registry import DEFAULT_EMBEDDING_MODEL, get_encoder
 
 # ================== Embedding Function ==================
 class GTEEmbeddingFunction:
-    def __init__(self, model_name="thenlper/gte-large-zh"):
-        print(f"📥 載入本地模型 {model_name} ...")
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, backend=None, workers=None, threads_per_worker=None):
+        self.model_name = model_name
+        self.backend = resolve_backend(backend)   # torch / onnx / onnx-int8，預設讀 EMBEDDING_BACKEND
+        # 模型由 model_registry 共用：同一 process 建立多個 embedding function 也只載入一份
+        self.model = get_encoder(model_name, self.backend, workers=workers, threads_per_worker=threads_per_worker)
+        if self.backend == "onnx-int8":
+            self.cache_namespace = f"{model_name}@onnx-int8"
 
     def __call__(self, input: list[str]) -> list[list[float]]:
-        return self.model.encode(input, show_progress_bar=False).tolist()
+        return self.encode(input)
+
+    def encode(self, texts: list[str], batch_size=32) -> list[list[float]]:
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False).tolist()
 
     def name(self) -> str:
         return "thenlper/gte-large-zh"
@@ -56,22 +65,26 @@ def split_into_clauses(text, max_len=500):
 
 
 # ================== 存入 ChromaDB ==================
-def save_contract(file_path, contract_name="contract"):
+def save_contract(file_path, contract_name="contract", embed_workers=None, batch_size=256):
+    """embed_workers > 1 時以多個 process 平行 embedding（大型合約 / 批量匯入用）"""
+    embedding_fn = with_embedding_cache(GTEEmbeddingFunction("thenlper/gte-large-zh", workers=embed_workers))
     client = chromadb.PersistentClient(path="./chroma_db")
     collection = client.get_or_create_collection(
         name="contracts",
-        embedding_function=GTEEmbeddingFunction("thenlper/gte-large-zh")
+        embedding_function=embedding_fn
     )
 
     text = load_contract(file_path)
     chunks = split_into_clauses(text, max_len=500)
 
-    for i, chunk in enumerate(chunks):
-        meta = {"contract": contract_name, "clause_id": i}
+    # 整批 encode 再一次寫入，不再逐條 add
+    for start in range(0, len(chunks), batch_size):
+        part = chunks[start:start + batch_size]
         collection.add(
-            documents=[chunk],
-            metadatas=[meta],
-            ids=[f"{contract_name}_{i}"]
+            documents=part,
+            metadatas=[{"contract": contract_name, "clause_id": i} for i in range(start, start + len(part))],
+            ids=[f"{contract_name}_{i}" for i in range(start, start + len(part))],
+            embeddings=embedding_fn.encode(part, batch_size=len(part))
         )
 
     print(f"✅ 已將 {len(chunks)} 個條款存入 contracts collection")
@@ -1,6 +1,10 @@
 import os
 import re
 import json
+import time
+import threading
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
 from datetime import datetime
 from docx import Document
 from dotenv import load_dotenv
@@ -23,6 +27,10 @@ if not PROJECT_ID or not RAG_CORPUS_NAME:
 REPORTS_DIR = "./reports"
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
+# 同時進行中的 Gemini 呼叫上限與每次呼叫的時限（秒）；未指定 concurrency 的分析（例如 app.py 的請求）共用同一個上限
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
 # ==========================
 # 初始化 Vertex AI RAG
 # ==========================
@@ -51,6 +59,43 @@ rag_model_reviewer = GenerativeModel(
     model_name="gemini-2.0-flash-001"
 )
 
+class GeminiLimiter:
+    """同時進行中的 Gemini 呼叫上限
+
+    generate_content 沒有 timeout 參數：每次呼叫在自己的 daemon thread 執行，呼叫端只等 timeout 秒。
+    等候名額與等候回應各以 timeout 為限，所以一次 generate() 最多等 2 * timeout 秒。
+    逾時的呼叫會在背景跑完後被丟棄，跑完之前仍佔著一個名額；名額全被卡住時，之後的呼叫等候名額逾時後失敗，不會無限期等待。
+    """
+
+    def __init__(self, concurrency=GEMINI_CONCURRENCY):
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def generate(self, model, prompt, timeout=None):
+        timeout = timeout or GEMINI_TIMEOUT
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"等候 Gemini 名額超過 {timeout}s（{self.concurrency} 個呼叫都未回應）")
+        future = Future()
+
+        def call():
+            try:
+                future.set_result(model.generate_content(prompt))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._slots.release()
+
+        threading.Thread(target=call, name="gemini", daemon=True).start()
+        try:
+            return future.result(timeout=timeout).text.strip()
+        except FutureTimeout:
+            raise TimeoutError(f"Gemini 超過 {timeout}s 未回應") from None
+
+_default_limiter = GeminiLimiter(GEMINI_CONCURRENCY)
+
+def generate(model, prompt, timeout=None, limiter=None):
+    return (limiter or _default_limiter).generate(model, prompt, timeout)
+
 # ==========================
 # 清理輸出，移除冗餘字眼
 # ==========================
@@ -70,7 +115,7 @@ def clean_output(text: str) -> str:
 # ==========================
 # 條款分析（使用 RAG + 複核）
 # ==========================
-def analyze_clause(clause_text: str):
+def analyze_clause(clause_text: str, timeout=None, limiter=None):
     try:
         # 初稿
         prompt_primary = f"""
@@ -84,7 +129,7 @@ def analyze_clause(clause_text: str):
 2. 潛在風險
 3. 法律依據
 """
-        draft = rag_model_primary.generate_content(prompt_primary).text.strip()
+        draft = generate(rag_model_primary, prompt_primary, timeout, limiter)
 
         # 複核（要求乾淨輸出）
         prompt_review = f"""
@@ -98,7 +143,7 @@ def analyze_clause(clause_text: str):
 
 請輸出乾淨、正式的最終分析：
 """
-        final = rag_model_reviewer.generate_content(prompt_review).text.strip()
+        final = generate(rag_model_reviewer, prompt_review, timeout, limiter)
         return clean_output(final)
 
     except Exception as e:
@@ -108,10 +153,10 @@ def analyze_clause(clause_text: str):
 # ==========================
 # 全局合約分析（使用 RAG + 複核）
 # ==========================
-def analyze_contract_global(contract_text: str):
+def analyze_contract_summary(contract_text: str, timeout=None, limiter=None):
     limited_text = contract_text[:6000]
-
-    summary_prompt = f"""
+    try:
+        summary_prompt = f"""
 請分析以下合約內容，提供簡潔的摘要：
 1. 合約類型和目的
 2. 主要當事人
@@ -120,19 +165,9 @@ def analyze_contract_global(contract_text: str):
 合約內容：
 {limited_text}
 """
-    risk_prompt = f"""
-請分析以下合約內容，識別潛在風險：
-1. 法律風險
-2. 商業風險
-3. 執行風險
-
-合約內容：
-{limited_text}
-"""
-
-    print("🔍 生成合約摘要...")
-    draft_summary = rag_model_primary.generate_content(summary_prompt).text.strip()
-    summary_review_prompt = f"""
+        print("🔍 生成合約摘要...")
+        draft_summary = generate(rag_model_primary, summary_prompt, timeout, limiter)
+        summary_review_prompt = f"""
 你是一位嚴謹的法律審核助手。請直接輸出最終摘要，不要包含「以下是」、「修正說明」、「修正後」等字眼。
 
 合約內容：
@@ -143,12 +178,28 @@ def analyze_contract_global(contract_text: str):
 
 請輸出乾淨、正式的最終摘要：
 """
-    summary = rag_model_reviewer.generate_content(summary_review_prompt).text.strip()
-    summary = clean_output(summary)
+        summary = generate(rag_model_reviewer, summary_review_prompt, timeout, limiter)
+        return clean_output(summary)
+
+    except Exception as e:
+        print(f"❌ 摘要分析錯誤: {e}")
+        return f"摘要分析失敗: {str(e)}"
+
+def analyze_contract_risks(contract_text: str, timeout=None, limiter=None):
+    limited_text = contract_text[:6000]
+    try:
+        risk_prompt = f"""
+請分析以下合約內容，識別潛在風險：
+1. 法律風險
+2. 商業風險
+3. 執行風險
 
-    print("⚠️ 分析潛在風險...")
-    draft_risks = rag_model_primary.generate_content(risk_prompt).text.strip()
-    risks_review_prompt = f"""
+合約內容：
+{limited_text}
+"""
+        print("⚠️ 分析潛在風險...")
+        draft_risks = generate(rag_model_primary, risk_prompt, timeout, limiter)
+        risks_review_prompt = f"""
 你是一位嚴謹的法律審核助手。請直接輸出最終風險分析，不要包含「以下是」、「修正說明」、「修正後」等字眼。
 
 合約內容：
@@ -159,10 +210,16 @@ def analyze_contract_global(contract_text: str):
 
 請輸出乾淨、正式的最終風險分析：
 """
-    risks = rag_model_reviewer.generate_content(risks_review_prompt).text.strip()
-    risks = clean_output(risks)
+        risks = generate(rag_model_reviewer, risks_review_prompt, timeout, limiter)
+        return clean_output(risks)
 
-    return {"summary": summary, "risks": risks}
+    except Exception as e:
+        print(f"❌ 風險分析錯誤: {e}")
+        return f"風險分析失敗: {str(e)}"
+
+def analyze_contract_global(contract_text: str, timeout=None, limiter=None):
+    return {"summary": analyze_contract_summary(contract_text, timeout, limiter),
+            "risks": analyze_contract_risks(contract_text, timeout, limiter)}
 
 # ==========================
 # 報告輸出
@@ -213,19 +270,36 @@ def save_json_report(filename, summary, risks, clause_analyses):
 # ==========================
 # 主流程：掃描 contracts/
 # ==========================
-def analyze_contract_file(file_path):
+def _timed_clause(clause, timeout, limiter):
+    t0 = time.perf_counter()
+    analysis = analyze_clause(clause, timeout, limiter)
+    return analysis, time.perf_counter() - t0
+
+def analyze_contract_file(file_path, concurrency=None, timeout=None):
+    """各條款、全局摘要與風險分析同時進行，同時進行中的 Gemini 呼叫最多 concurrency 個
+    （未指定時與同一 process 的其他分析共用 GEMINI_CONCURRENCY 的上限）；
+    結果依條款順序回傳，任一條款或摘要 / 風險失敗只會在該處留下「分析失敗」，報告照常產生。
+    """
     print(f"\n🚀 開始分析合約：{file_path}")
+    t0 = time.perf_counter()
     text = load_contract(file_path)
     clauses = split_into_clauses(text, max_len=600)
 
-    clause_analyses = []
-    for i, clause in enumerate(clauses, 1):
-        print(f"🔎 條款 {i} 分析中...")
-        analysis = analyze_clause(clause)
-        clause_analyses.append((clause, analysis))
-
-    global_analysis = analyze_contract_global(text)
-    summary, risks = global_analysis["summary"], global_analysis["risks"]
+    limiter = GeminiLimiter(concurrency) if concurrency else _default_limiter
+    # 每個 task 一次只佔一個名額（初稿 → 複核依序進行），thread 數與名額相同即可
+    with ThreadPoolExecutor(max_workers=limiter.concurrency, thread_name_prefix="clause") as executor:
+        summary_future = executor.submit(analyze_contract_summary, text, timeout, limiter)
+        risks_future = executor.submit(analyze_contract_risks, text, timeout, limiter)
+        futures = [executor.submit(_timed_clause, clause, timeout, limiter) for clause in clauses]
+        index = {future: i for i, future in enumerate(futures, 1)}
+        for done, future in enumerate(as_completed(futures), 1):
+            print(f"🔎 條款 {index[future]} 完成（{done}/{len(clauses)}，{future.result()[1]:.1f}s）")
+        results = [future.result() for future in futures]
+        summary, risks = summary_future.result(), risks_future.result()
+
+    clause_analyses = [(clause, analysis) for clause, (analysis, _) in zip(clauses, results)]
+    slowest = max((seconds for _, seconds in results), default=0.0)
+    print(f"⏱️ {len(clauses)} 個條款，最慢 {slowest:.1f}s，合計 {time.perf_counter() - t0:.1f}s")
 
     word_file = generate_word_report(file_path, summary, risks, clause_analyses)
     json_file = save_json_report(file_path, summary, risks, clause_analyses)
@@ -240,8 +314,13 @@ def analyze_contract_file(file_path):
     }
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=GEMINI_CONCURRENCY, help="同時進行中的 Gemini 呼叫上限")
+    parser.add_argument("--timeout", type=float, default=GEMINI_TIMEOUT, help="每次 Gemini 呼叫的時限（秒）")
+    args = parser.parse_args()
+
     contracts_dir = "./contracts"
     for filename in os.listdir(contracts_dir):
         file_path = os.path.join(contracts_dir, filename)
         if os.path.isfile(file_path) and filename.lower().endswith((".pdf", ".docx", ".txt")):
-            analyze_contract_file(file_path)
+            analyze_contract_file(file_path, concurrency=args.concurrency, timeout=args.timeout)
@@ -0,0 +1,173 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+
+# ================== Embedding 快取 ==================
+# 以 (模型名稱, 正規化文字的 hash) 為 key，把向量存到本地 SQLite：
+#   - 向量以 float32 原始位元組存放（不經 JSON / pickle）
+#   - 超過 max_bytes 時按最近使用時間淘汰（LRU）
+#   - 多個 process（入庫腳本、Streamlit、API）可共用同一個檔案
+# CachedEmbeddingFunction 包住 BGEEmbeddingFunction / GTEEmbeddingFunction，
+# Chroma 的 embedding_function 呼叫 (__call__) 與直接 encode() 都會先查快取。
+
+DEFAULT_CACHE_PATH = "./embedding_cache.sqlite3"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3   # 2 GB
+
+
+def normalize_text(text):
+    """NFKC + 壓縮空白；只差在全半形 / 空白的文字共用同一個向量"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(model_name, text):
+    raw = f"{model_name}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._approx_bytes = self._total_bytes()
+
+    def _total_bytes(self):
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()
+        return row[0]
+
+    def get_many(self, model_name, texts):
+        """回傳與 texts 對應的向量 list；沒有快取的位置為 None"""
+        keys = [cache_key(model_name, t) for t in texts]
+        found = {}
+        with self._lock:
+            # SQLite 預設最多 999 個參數，分批查詢
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                for key, dim, vec in self._conn.execute(
+                    f"SELECT key, dim, vec FROM embeddings WHERE key IN ({marks})", part
+                ):
+                    found[key] = np.frombuffer(vec, dtype=np.float32, count=dim)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        self.hits += sum(1 for k in keys if k in found)
+        self.misses += sum(1 for k in keys if k not in found)
+        return [found.get(k) for k in keys]
+
+    def put_many(self, model_name, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vec in zip(texts, vectors):
+            arr = np.asarray(vec, dtype=np.float32)
+            rows.append((cache_key(model_name, text), arr.shape[0], arr.tobytes(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vec, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._approx_bytes += sum(len(r[2]) for r in rows)
+            if self._approx_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """刪除最久未使用的向量，直到總大小降到上限的 90%"""
+        total = self._total_bytes()
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                victims.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self._conn.commit()
+        self._approx_bytes = total
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._approx_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingFunction:
+    """包住有 encode() / name() 的 embedding function，先查快取，只把未命中的文字送進模型"""
+
+    def __init__(self, embedding_fn, cache):
+        self.embedding_fn = embedding_fn
+        self.cache = cache
+        # 快取 key 的命名空間；輸出與原模型有差異的 backend（如 onnx-int8）會另設 cache_namespace
+        self.model_name = (getattr(embedding_fn, "cache_namespace", None)
+                           or getattr(embedding_fn, "model_name", None) or embedding_fn.name())
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return self.encode(input)
+
+    def encode(self, texts: list[str], batch_size=32) -> list[list[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            new_texts = [texts[i] for i in missing]
+            new_vectors = self.embedding_fn.encode(new_texts, batch_size=batch_size)
+            self.cache.put_many(self.model_name, new_texts, new_vectors)
+            for i, vec in zip(missing, new_vectors):
+                vectors[i] = vec
+        return [np.asarray(v, dtype=np.float32).tolist() for v in vectors]
+
+    def name(self) -> str:
+        # 與原本的 embedding function 同名，Chroma 既有 collection 不會判定為不同模型
+        return self.embedding_fn.name()
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def with_embedding_cache(embedding_fn, path=None, max_bytes=None):
+    """用同一 process 共用的 EmbeddingCache 包住 embedding function
+
+    路徑與上限可由環境變數 EMBEDDING_CACHE_PATH / EMBEDDING_CACHE_MAX_MB 設定；
+    EMBEDDING_CACHE_PATH=off 時停用快取，直接回傳原本的 embedding function。
+    """
+    path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if path.lower() == "off":
+        return embedding_fn
+    if max_bytes is None:
+        max_mb = os.getenv("EMBEDDING_CACHE_MAX_MB")
+        max_bytes = int(max_mb) * 1024 ** 2 if max_mb else DEFAULT_MAX_BYTES
+    with _shared_lock:
+        cache = _shared_caches.get(path)
+        if cache is None:
+            cache = _shared_caches[path] = EmbeddingCache(path, max_bytes=max_bytes)
+    return CachedEmbeddingFunction(embedding_fn, cache)
@@ -0,0 +1,74 @@
+import os
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# ================== 多 process embedding ==================
+# SentenceTransformer.encode 只用一個 process；大量入庫時把每批文字切成小片，
+# 分給多個 worker process（各自載入一份模型）平行 encode，再按原順序拼回。
+#   - 每個 worker 的執行緒數固定（OMP / MKL / torch / ONNX Runtime），避免 N 個 worker × 全部核心互相搶
+#   - 用 spawn 啟動，worker 不會繼承主 process 已初始化的 torch 執行緒池
+#   - encode() 與 SentenceTransformer.encode 相容，可直接放進 BGEEmbeddingFunction / GTEEmbeddingFunction
+# 每個 worker 都有一份模型（gte-large-zh 約 1.3 GB），worker 數要按記憶體決定。
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ORT_NUM_THREADS")
+
+_encoder = None
+
+
+def _init_worker(model_name, backend, threads):
+    global _encoder
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    from onnx_embedding import load_encoder
+    _encoder = load_encoder(model_name, backend)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _encode_shard(texts, batch_size):
+    return np.asarray(_encoder.encode(texts, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+
+
+class EmbeddingPool:
+    def __init__(self, model_name, workers=None, threads_per_worker=None, backend=None, min_shard=8):
+        cpus = os.cpu_count() or 1
+        self.workers = workers or cpus
+        self.threads_per_worker = threads_per_worker or max(1, cpus // self.workers)
+        self.min_shard = min_shard
+        print(f"🧵 embedding pool：{self.workers} 個 worker × {self.threads_per_worker} 執行緒")
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, self.threads_per_worker),
+        )
+        atexit.register(self.close)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        """回傳 float32[N, D]，順序與 texts 相同"""
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size=batch_size)[0]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # 每個 worker 分到一片；片太小時模型的批次效率差，少用幾個 worker
+        shard = max(self.min_shard, -(-len(texts) // self.workers))
+        shards = [texts[start:start + shard] for start in range(0, len(texts), shard)]
+        results = self.executor.map(_encode_shard, shards, [min(batch_size, shard)] * len(shards))
+        return np.concatenate(list(results))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,114 @@
+import json
+import time
+import argparse
+import numpy as np
+import chromadb
+from bm25_index import BM25Index
+from legal_tokenizer import init_jieba
+from model_registry import get_cross_encoder, get_embedding_function
+from retrieval_engine import CASCADE_KINDS, HybridRetriever, build_prefilter, prune, rerank
+
+# ================== Cascade rerank 評估 ==================
+# 以「bge-reranker-large 為全部候選評分」的排序為標準答案，比較 cascade（先用輕量模型刪減到 keep 個）：
+#   - 延遲：第一段 + 第二段的 rerank 時間，相對全量 rerank 省了多少
+#   - 品質：nDCG@k（標準答案前 k 名依名次給 k..1 分，其餘 0 分）
+# 查詢檔每行一個問題（或 JSONL，取 "query" 欄位）。
+#
+# 用法：python eval_cascade.py --queries queries.txt --cascade embedding cross-encoder --keep 5 8 12
+
+
+def load_queries(path):
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return queries
+
+
+def ndcg_at_k(reference_ids, ranked_ids, k):
+    gains = {doc_id: k - rank for rank, doc_id in enumerate(reference_ids[:k])}
+    dcg = sum(gains.get(doc_id, 0) / np.log2(rank + 2) for rank, doc_id in enumerate(ranked_ids[:k]))
+    ideal = sum((k - rank) / np.log2(rank + 2) for rank in range(min(k, len(reference_ids))))
+    return dcg / ideal if ideal else 1.0
+
+
+def ranked_ids(reranked):
+    return [candidate[1].get("id") or candidate[0] for candidate, _ in reranked]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", required=True, help="查詢檔（每行一個問題，或 JSONL）")
+    parser.add_argument("--n", type=int, default=10, help="向量 / BM25 各取的候選數")
+    parser.add_argument("--k", type=int, default=3, help="nDCG@k（等同最終 top_k）")
+    parser.add_argument("--cascade", nargs="+", choices=CASCADE_KINDS[1:], default=["embedding"])
+    parser.add_argument("--keep", type=int, nargs="+", default=[5, 8, 12])
+    parser.add_argument("--cascade-model", default="BAAI/bge-reranker-base")
+    parser.add_argument("--output", default=None, help="結果 JSON 輸出檔（預設印到 stdout）")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    embedder = get_embedding_function()
+    client = chromadb.PersistentClient(path="./chroma_db")
+    laws_collection = client.get_collection(name="hk_cap4_laws", embedding_function=embedder)
+    init_jieba()
+    retriever = HybridRetriever(laws_collection, BM25Index.load("bm25_index"))
+    reranker = get_cross_encoder("BAAI/bge-reranker-large")
+
+    candidates = [retriever.search(q, n=args.n) for q in queries]
+    reranker.predict([("暖機", "暖機")])   # 第一次呼叫較慢，不計入
+
+    # 標準答案：全部候選都用 bge-reranker-large
+    reference, full_ms = [], []
+    for query, cands in zip(queries, candidates):
+        t0 = time.perf_counter()
+        reference.append(ranked_ids(rerank(reranker, query, cands, top_k=len(cands))))
+        full_ms.append((time.perf_counter() - t0) * 1000)
+
+    results = []
+    for kind in args.cascade:
+        prefilter = build_prefilter(kind, embedding_fn=embedder, model_name=args.cascade_model)
+        prune(prefilter, "暖機", [("暖機", {}, 0, "")] * 2, keep=1)
+        for keep in args.keep:
+            ndcgs, stage1_ms, total_ms = [], [], []
+            for query, cands, ref in zip(queries, candidates, reference):
+                t0 = time.perf_counter()
+                survivors = prune(prefilter, query, cands, keep)
+                t1 = time.perf_counter()
+                ranked = rerank(reranker, query, survivors, top_k=args.k)
+                t2 = time.perf_counter()
+                stage1_ms.append((t1 - t0) * 1000)
+                total_ms.append((t2 - t0) * 1000)
+                ndcgs.append(ndcg_at_k(ref, ranked_ids(ranked), args.k))
+            results.append({
+                "cascade": kind, "keep": keep,
+                "ndcg": round(float(np.mean(ndcgs)), 4),
+                "ndcg_loss": round(1 - float(np.mean(ndcgs)), 4),
+                "stage1_ms": round(float(np.mean(stage1_ms)), 2),
+                "latency_ms": round(float(np.mean(total_ms)), 2),
+                "latency_saved_pct": round(100 * (1 - np.mean(total_ms) / np.mean(full_ms)), 1),
+            })
+            r = results[-1]
+            print(f"{kind:<14} keep={keep:<3} nDCG@{args.k}={r['ndcg']:.4f}（損失 {r['ndcg_loss']:.4f}）"
+                  f" 延遲 {r['latency_ms']:.1f} ms（省 {r['latency_saved_pct']}%）")
+
+    report = {
+        "n_queries": len(queries), "n": args.n, "k": args.k,
+        "avg_candidates": round(float(np.mean([len(c) for c in candidates])), 2),
+        "full_rerank_ms": round(float(np.mean(full_ms)), 2),
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"✅ 結果已寫入 {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
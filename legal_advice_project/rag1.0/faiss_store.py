@@ -0,0 +1,239 @@
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+import threading
+import numpy as np
+import faiss
+from metadata_filter import MetadataColumns
+
+# ================== FAISS 向量庫 ==================
+# hk_cap4_laws 的另一種向量後端（取代 Chroma 的 PersistentClient）：
+#   - hnsw：IndexHNSWFlat（inner product，向量已正規化 = cosine），召回高、記憶體 = float32 向量
+#   - ivfpq：IVF + Product Quantization，每個向量只佔 pq_m bytes，適合整部法例匯編的規模
+#   - 索引以 mmap 載入（MMAP_FLAGS）：ivfpq 的 inverted lists 一律 mmap；hnsw 的 float32 向量只有在 faiss 提供
+#     IO_FLAG_MMAP_IFC 時（較新版本）才會 mmap，圖的鄰接表（每個向量約 hnsw_m * 8 bytes）仍讀入記憶體；
+#     舊版 faiss 只有 IO_FLAG_MMAP，對 hnsw 沒有作用，整個索引都會讀進記憶體
+#   - id / 條文 / metadata 存在旁邊的 SQLite（meta.sqlite3），只讀取結果那幾列
+# query() 的參數與回傳格式與 Chroma collection.query 相同（包括 where 篩選），hybrid_search 可直接替換。
+# 有 where 時以 IDSelector 只搜尋符合的 row；hnsw 篩出的 row 不多時直接精確計分，召回不受圖結構影響。
+#
+# 建立：python faiss_store.py --source chroma --kind hnsw        # 由現有 Chroma collection 匯出向量，不需重新 embedding
+#       python faiss_store.py --source law_vectors --kind ivfpq  # 由量化向量庫的 float32 原始向量建立
+#
+# 目錄格式：
+#   meta.json       種類 / 維度 / 筆數 / 建立參數
+#   index.faiss     FAISS 索引，第 i 個向量對應 meta.sqlite3 的 row = i
+#   meta.sqlite3    chunks(row, id, document, metadata JSON)
+
+FORMAT_VERSION = 1
+INDEX_KINDS = ("hnsw", "ivfpq")
+EXACT_FILTER_ROWS = 4096
+PQ_NBITS = 8   # 每個 PQ sub-quantizer 的 bits（2^8 = 256 個中心）
+# IO_FLAG_MMAP_IFC 以零複製方式 mmap flat 向量（hnsw 的 storage）；IO_FLAG_MMAP 只對 IVF 的 inverted lists 有效
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _normalize(vectors):
+    vectors = np.array(vectors, dtype=np.float32, order="C")   # 複製一份，normalize_L2 是原地修改
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(vectors, kind="hnsw", hnsw_m=32, ef_construction=200, nlist=None, pq_m=64):
+    """由已正規化的 float32 向量建立索引"""
+    n, dim = vectors.shape
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif kind == "ivfpq":
+        if dim % pq_m:
+            raise ValueError(f"❌ pq_m={pq_m} 必須整除向量維度 {dim}")
+        if n < 2 ** PQ_NBITS:
+            # 每個 sub-quantizer 要訓練 2^nbits 個中心，訓練向量少於此數時 FAISS 無法訓練
+            raise ValueError(f"❌ ivfpq 至少需要 {2 ** PQ_NBITS} 個向量（目前 {n} 個），條文不多時請用 --kind hnsw")
+        nlist = nlist or max(1, min(int(4 * np.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    else:
+        raise ValueError(f"❌ 不支援的索引種類: {kind}（可選 {', '.join(INDEX_KINDS)}）")
+    index.add(vectors)
+    return index
+
+
+def write_store(path, ids, documents, metadatas, embeddings, kind="hnsw", model_name="", **index_kwargs):
+    """寫出完整的 FAISS 向量庫（先寫到 path.tmp，完成後才替換舊目錄）"""
+    vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    index = build_index(vectors, kind=kind, **index_kwargs)
+    faiss.write_index(index, os.path.join(tmp_path, "index.faiss"))
+
+    conn = sqlite3.connect(os.path.join(tmp_path, "meta.sqlite3"))
+    conn.execute("CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL, document TEXT, metadata TEXT)")
+    conn.executemany(
+        "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+        ((i, chunk_id, doc, json.dumps(meta or {}, ensure_ascii=False))
+         for i, (chunk_id, doc, meta) in enumerate(zip(ids, documents, metadatas)))
+    )
+    conn.execute("CREATE INDEX idx_chunks_id ON chunks(id)")
+    conn.commit()
+    conn.close()
+
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT_VERSION, "kind": kind, "dim": int(vectors.shape[1]),
+                   "count": len(ids), "model": model_name, "params": index_kwargs}, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+class FaissVectorStore:
+    def __init__(self, path, embedding_function=None, ef_search=128, nprobe=16, mmap=True):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"❌ 不支援的 FAISS 向量庫格式: {self.meta.get('format')}")
+        self.path = path
+        self.embedding_function = embedding_function
+
+        index_path = os.path.join(path, "index.faiss")
+        self.index = None
+        if mmap:
+            try:
+                self.index = faiss.read_index(index_path, MMAP_FLAGS)
+            except RuntimeError:
+                print("⚠️ 此索引種類不支援 mmap 載入，改為讀入記憶體")
+        if self.index is None:
+            self.index = faiss.read_index(index_path)
+        if self.meta["kind"] == "hnsw":
+            self.index.hnsw.efSearch = ef_search
+        else:
+            self.index.nprobe = nprobe
+
+        self._conn = sqlite3.connect(f"file:{os.path.join(path, 'meta.sqlite3')}?mode=ro", uri=True,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        self.columns = MetadataColumns(self._read_column)
+
+    @classmethod
+    def load(cls, path="./law_faiss", embedding_function=None, **kwargs):
+        return cls(path, embedding_function=embedding_function, **kwargs)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self):
+        return self.meta["count"]
+
+    def rows(self, row_ids):
+        """row → {"id", "document", "metadata"}"""
+        row_ids = [int(r) for r in row_ids]
+        if not row_ids:
+            return {}
+        marks = ",".join("?" * len(row_ids))
+        with self._lock:
+            records = self._conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({marks})", row_ids
+            ).fetchall()
+        return {row: {"id": chunk_id, "document": doc, "metadata": json.loads(meta)}
+                for row, chunk_id, doc, meta in records}
+
+    def _read_column(self, field):
+        with self._lock:
+            records = self._conn.execute("SELECT metadata FROM chunks ORDER BY row").fetchall()
+        return [json.loads(meta).get(field) for meta, in records]
+
+    def _search_exact(self, queries, rows, k):
+        """只有少數 row 時直接以 float32 向量精確計分（僅 hnsw，IndexHNSWFlat 存有原始向量）"""
+        vectors = self.index.reconstruct_batch(rows)
+        scores = queries @ vectors.T
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, order, axis=1), rows[order]
+
+    def search(self, query_embeddings, n_results=10, where=None):
+        """回傳 (similarities[Q, k], rows[Q, k])；不足 k 個時 row 為 -1；where 與 Chroma 相同"""
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.meta["dim"]))
+        if where is None:
+            return self.index.search(queries, min(n_results, max(self.count(), 1)))
+        rows = self.columns.rows(where).astype(np.int64)
+        k = min(n_results, len(rows))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        if self.meta["kind"] == "hnsw" and len(rows) <= EXACT_FILTER_ROWS:
+            return self._search_exact(queries, rows, k)
+        selector = faiss.IDSelectorBatch(rows)
+        if self.meta["kind"] == "hnsw":
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.index.hnsw.efSearch)
+        else:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.index.nprobe)
+        return self.index.search(queries, k, params=params)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10,
+              include=("documents", "metadatas", "distances"), where=None):
+        """與 Chroma collection.query 相同的介面；distances 為 cosine 距離（1 - 相似度）"""
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        sims, rows = self.search(query_embeddings, n_results=n_results, where=where)
+        records = self.rows({int(r) for r in rows.ravel() if r >= 0})
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for sim_row, id_row in zip(sims, rows):
+            hits = [(records[int(r)], float(s)) for s, r in zip(sim_row, id_row) if r >= 0]
+            result["ids"].append([rec["id"] for rec, _ in hits])
+            result["documents"].append([rec["document"] for rec, _ in hits])
+            result["metadatas"].append([rec["metadata"] for rec, _ in hits])
+            result["distances"].append([1 - s for _, s in hits])
+        return {k: v for k, v in result.items() if k == "ids" or k in include}
+
+
+# ================== 由現有向量建立 ==================
+def export_chroma(chroma_path="./chroma_db", name="hk_cap4_laws", page_size=2000):
+    """由 Chroma collection 分頁讀出 ids / 條文 / metadata / 向量"""
+    import chromadb
+    collection = chromadb.PersistentClient(path=chroma_path).get_collection(name=name)
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        embeddings.extend(page["embeddings"])
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    return ids, documents, metadatas, np.asarray(embeddings, dtype=np.float32)
+
+
+def export_quantized(path="./law_vectors"):
+    from quantized_store import QuantizedVectorStore
+    store = QuantizedVectorStore.load(path)
+    rows = [r for _, r in store.iter_rows()]
+    embeddings = np.asarray(store.full, dtype=np.float32)
+    store.close()
+    return [r["id"] for r in rows], [r["document"] for r in rows], [r["metadata"] for r in rows], embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["chroma", "law_vectors"], default="chroma", help="向量來源")
+    parser.add_argument("--kind", choices=INDEX_KINDS, default="hnsw")
+    parser.add_argument("--output", default="./law_faiss")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 分群數（預設約 4√N）")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ 子向量數（每個向量佔的 bytes，須整除維度）")
+    args = parser.parse_args()
+
+    ids, documents, metadatas, embeddings = export_chroma() if args.source == "chroma" else export_quantized()
+    print(f"📦 由 {args.source} 讀出 {len(ids)} 個向量，建立 {args.kind} 索引 ...")
+    index_kwargs = ({"hnsw_m": args.hnsw_m, "ef_construction": args.ef_construction} if args.kind == "hnsw"
+                    else {"nlist": args.nlist, "pq_m": args.pq_m})
+    write_store(args.output, ids, documents, metadatas, embeddings, kind=args.kind,
+                model_name="thenlper/gte-large-zh", **index_kwargs)
+    print(f"✅ FAISS 向量庫已儲存到 {args.output}/")
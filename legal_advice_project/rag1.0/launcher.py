@@ -5,11 +5,11 @@ import time
 import os
 import requests
 import sys
+from ollama_client import OllamaError, get_client as get_ollama_client
 
 OLLAMA_CMD = "ollama"
 OLLAMA_DOWNLOAD_URL = "https://ollama.com/download/OllamaSetup.exe"
 OLLAMA_INSTALLER = "OllamaSetup.exe"
-OLLAMA_API_URL = "http://localhost:11434/api/tags"
 
 # 預設 Ollama 的模型快取目錄
 OLLAMA_MODELS_DIR = os.path.expanduser("~/.ollama/models")
@@ -45,18 +45,22 @@ def install_ollama():
 
 def wait_for_ollama():
     """等待 Ollama API 啟動"""
+    client = get_ollama_client()
     for _ in range(30):
-        try:
-            resp = requests.get(OLLAMA_API_URL, timeout=2)
-            if resp.status_code == 200:
-                return True
-        except requests.exceptions.RequestException:
-            pass
+        if client.is_ready(timeout=2):
+            return True
         time.sleep(1)
     return False
 
 
 def list_installed_models():
+    # API 已啟動時直接問 Ollama（與 Web UI 共用同一個 client），否則退回 ollama list
+    client = get_ollama_client()
+    if client.is_ready(timeout=1):
+        try:
+            return client.list_models()
+        except OllamaError:
+            pass
     try:
         result = subprocess.run([OLLAMA_CMD, "list"],
                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
@@ -0,0 +1,74 @@
+import os
+import hashlib
+import threading
+from functools import lru_cache
+from multiprocessing import Pool
+import jieba
+
+# ================== 中文斷詞 ==================
+# BM25 建索引與查詢共用的 jieba 斷詞：
+#   - 每個 process 只初始化一次 jieba（可加載法律詞彙自訂詞典）
+#   - 建索引時把條文分給多個 process 平行斷詞
+#   - 查詢斷詞結果以 LRU 快取
+# 自訂詞典：預設讀取 ./legal_terms.txt（jieba 詞典格式：詞 [詞頻] [詞性]，每行一個），
+# 也可用環境變數 LEGAL_USER_DICT 指定；檔案不存在時只用預設詞典。
+
+DEFAULT_USER_DICT = "./legal_terms.txt"
+
+_init_lock = threading.Lock()
+_initialized_dict = None
+
+
+def user_dict_path(user_dict=None):
+    path = user_dict or os.getenv("LEGAL_USER_DICT", DEFAULT_USER_DICT)
+    return path if path and os.path.exists(path) else None
+
+
+def init_jieba(user_dict=None):
+    """載入 jieba 詞典（只做一次），應在程式啟動時呼叫，避免第一個查詢才載入"""
+    global _initialized_dict
+    path = user_dict_path(user_dict)
+    with _init_lock:
+        if _initialized_dict is not None:
+            return
+        jieba.setLogLevel(60)   # 關掉 "Building prefix dict" 之類的訊息
+        jieba.initialize()
+        if path:
+            jieba.load_userdict(path)
+            print(f"📚 已載入法律詞典 {path}")
+        _initialized_dict = path or ""
+
+
+def tokenizer_signature(user_dict=None):
+    """斷詞設定的指紋（jieba 版本 + 自訂詞典內容），詞典改變時舊的斷詞結果不可沿用"""
+    h = hashlib.sha256(f"jieba-{jieba.__version__}".encode("utf-8"))
+    path = user_dict_path(user_dict)
+    if path:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def tokenize(text):
+    init_jieba()
+    return list(jieba.cut(text))
+
+
+@lru_cache(maxsize=4096)
+def _tokenize_query_cached(query):
+    return tuple(tokenize(query))
+
+
+def tokenize_query(query):
+    """查詢斷詞（快取），回傳 list"""
+    return list(_tokenize_query_cached(query))
+
+
+def tokenize_corpus(texts, workers=None, chunksize=64):
+    """平行斷詞；workers=1 或文本很少時直接在本 process 處理"""
+    texts = list(texts)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(texts) < chunksize * 2:
+        return [tokenize(t) for t in texts]
+    with Pool(processes=workers, initializer=init_jieba, initargs=(user_dict_path(),)) as pool:
+        return pool.map(tokenize, texts, chunksize=chunksize)
@@ -1,4 +1,5 @@
 import os
+import sys
 import xml.etree.ElementTree as ET
 
 # eLegislation XML namespace
@@ -29,8 +30,68 @@ def extract_text_with_refs(node):
     return "".join(parts)
 
 
-def parse_law(xml_file):
+def part_heading_line(part_num, part_heading):
+    if part_heading is not None and part_heading.text:
+        return f"## {part_num.text.strip()} {part_heading.text.strip()}\n"
+    return f"## {part_num.text.strip()}\n"
+
+
+def section_lines(section):
+    """單一條文 <section> → Markdown 行"""
+    lines = []
+    sec_num = section.find("hklm:num", NS)
+    sec_heading = section.find("hklm:heading", NS)
+
+    if sec_num is not None:
+        if sec_heading is not None and sec_heading.text:
+            lines.append(f"### 第{sec_num.text.strip()}條 {sec_heading.text.strip()}\n")
+        else:
+            lines.append(f"### 第{sec_num.text.strip()}條\n")
+
+    # 條文主體 <text>
+    text = section.find("hklm:text", NS)
+    if text is not None:
+        text_str = extract_text_with_refs(text)
+        if text_str:
+            lines.append(text_str + "\n")
+
+    # 定義 <def>
+    for d in section.findall("hklm:def", NS):
+        term_ch = d.find("hklm:term", NS)
+        term_en = d.find("hklm:term[@xml:lang='en']", NS)
+        lead_in = d.find("hklm:leadIn", NS)
+        content = d.find("hklm:content", NS)
+
+        term_text = term_ch.text.strip() if (term_ch is not None and term_ch.text) else ""
+        en_text = term_en.text.strip() if (term_en is not None and term_en.text) else ""
+        lead_text = extract_text_with_refs(lead_in) if lead_in is not None else ""
+        cont_text = extract_text_with_refs(content) if content is not None else ""
+
+        term_display = f"**{term_text} ({en_text})**" if en_text else f"**{term_text}**"
+        def_line = f"{term_display}：{lead_text}{cont_text}"
+        lines.append(def_line + "\n")
+
+    # 子款 <subsection>
+    for sub in section.findall("hklm:subsection", NS):
+        sub_num = sub.find("hklm:num", NS)
+        sub_content = sub.find("hklm:content", NS)
+        if sub_num is not None:
+            content_text = extract_text_with_refs(sub_content)
+            lines.append(f"({sub_num.text.strip()}) {content_text}\n")
+
+    # 修訂註 <sourceNote>
+    for note in section.findall("hklm:sourceNote", NS):
+        note_text = extract_text_with_refs(note)
+        if note_text:
+            lines.append(f"（{note_text}）\n")
+    return lines
+
+
+def parse_law(xml_file, streaming=False):
     """將單一香港法規 XML 轉換為 Markdown 字串"""
+    if streaming:
+        return "\n".join(iter_law_lines(xml_file))
+
     tree = ET.parse(xml_file)
     root = tree.getroot()
     
@@ -49,63 +110,74 @@ def parse_law(xml_file):
         part_num = part.find("hklm:num", NS)
         part_heading = part.find("hklm:heading", NS)
         if part_num is not None:
-            if part_heading is not None and part_heading.text:
-                lines.append(f"## {part_num.text.strip()} {part_heading.text.strip()}\n")
-            else:
-                lines.append(f"## {part_num.text.strip()}\n")
+            lines.append(part_heading_line(part_num, part_heading))
         
         # 遍歷各條文
         for section in part.findall("hklm:section", NS):
-            sec_num = section.find("hklm:num", NS)
-            sec_heading = section.find("hklm:heading", NS)
-
-            if sec_num is not None:
-                if sec_heading is not None and sec_heading.text:
-                    lines.append(f"### 第{sec_num.text.strip()}條 {sec_heading.text.strip()}\n")
-                else:
-                    lines.append(f"### 第{sec_num.text.strip()}條\n")
-            
-            # 條文主體 <text>
-            text = section.find("hklm:text", NS)
-            if text is not None:
-                text_str = extract_text_with_refs(text)
-                if text_str:
-                    lines.append(text_str + "\n")
-            
-            # 定義 <def>
-            for d in section.findall("hklm:def", NS):
-                term_ch = d.find("hklm:term", NS)
-                term_en = d.find("hklm:term[@xml:lang='en']", NS)
-                lead_in = d.find("hklm:leadIn", NS)
-                content = d.find("hklm:content", NS)
-                
-                term_text = term_ch.text.strip() if (term_ch is not None and term_ch.text) else ""
-                en_text = term_en.text.strip() if (term_en is not None and term_en.text) else ""
-                lead_text = extract_text_with_refs(lead_in) if lead_in is not None else ""
-                cont_text = extract_text_with_refs(content) if content is not None else ""
-
-                term_display = f"**{term_text} ({en_text})**" if en_text else f"**{term_text}**"
-                def_line = f"{term_display}：{lead_text}{cont_text}"
-                lines.append(def_line + "\n")
-
-            # 子款 <subsection>
-            for sub in section.findall("hklm:subsection", NS):
-                sub_num = sub.find("hklm:num", NS)
-                sub_content = sub.find("hklm:content", NS)
-                if sub_num is not None:
-                    content_text = extract_text_with_refs(sub_content)
-                    lines.append(f"({sub_num.text.strip()}) {content_text}\n")
-
-            # 修訂註 <sourceNote>
-            for note in section.findall("hklm:sourceNote", NS):
-                note_text = extract_text_with_refs(note)
-                if note_text:
-                    lines.append(f"（{note_text}）\n")
+            lines.extend(section_lines(section))
     
     return "\n".join(lines)
 
 
-def batch_convert(input_folder, output_folder):
+def iter_law_lines(xml_file):
+    """iterparse 串流版 parse_law：逐行 yield Markdown，處理完的節點即時釋放
+
+    輸出與 parse_law 相同，但記憶體只取決於單一條文 / 部份的大小，不隨 XML 檔案變大。
+    """
+    def tag_of(elem):
+        return elem.tag.rsplit("}", 1)[-1]
+
+    stack = []       # 目前開啟中的節點
+    parts = []       # 開啟中的 <part>：{"num", "heading", "lines", "children"}
+    hold = 0         # 開啟中的 section / longTitle；其子節點要留到它們結束才處理
+    long_title_done = False
+
+    for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+        tag = tag_of(elem)
+        if event == "start":
+            stack.append(elem)
+            if tag == "part":
+                parts.append({"num": None, "heading": None, "lines": [], "children": []})
+            elif tag in ("section", "longTitle"):
+                hold += 1
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        parent_tag = tag_of(parent) if parent is not None else ""
+
+        if tag == "docName" and parent_tag == "meta" and len(stack) == 2:
+            if elem.text:
+                yield f"# {elem.text.strip()} 高等法院條例\n"
+        elif tag == "content" and parent_tag == "longTitle" and not long_title_done:
+            long_title_done = True
+            if elem.text:
+                yield f"> {extract_text_with_refs(elem)}\n"
+        elif parent_tag == "part" and tag in ("num", "heading") and parts[-1][tag] is None:
+            parts[-1][tag] = elem
+        elif parent_tag == "part" and tag == "section":
+            parts[-1]["lines"].extend(section_lines(elem))
+        elif tag == "part":
+            # 與 findall(".//part") 的先序次序一致：本部份標題與條文，之後才是內層部份
+            state = parts.pop()
+            part_lines = []
+            if state["num"] is not None:
+                part_lines.append(part_heading_line(state["num"], state["heading"]))
+            part_lines.extend(state["lines"])
+            for child_lines in state["children"]:
+                part_lines.extend(child_lines)
+            if parts:
+                parts[-1]["children"].append(part_lines)
+            else:
+                yield from part_lines
+
+        if tag in ("section", "longTitle"):
+            hold -= 1
+        if hold == 0 and parent is not None:
+            parent.remove(elem)
+
+
+def batch_convert(input_folder, output_folder, streaming=False):
     """批次轉換資料夾內所有 XML → Markdown"""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -117,9 +189,15 @@ def batch_convert(input_folder, output_folder):
             md_path = os.path.join(output_folder, md_name)
             
             try:
-                md_content = parse_law(xml_path)
-                with open(md_path, "w", encoding="utf-8") as f:
-                    f.write(md_content)
+                if streaming:
+                    # 逐行寫出，不在記憶體中組合整份 Markdown
+                    with open(md_path, "w", encoding="utf-8") as f:
+                        for i, line in enumerate(iter_law_lines(xml_path)):
+                            f.write(line if i == 0 else "\n" + line)
+                else:
+                    md_content = parse_law(xml_path)
+                    with open(md_path, "w", encoding="utf-8") as f:
+                        f.write(md_content)
                 print(f"✅ 轉換完成: {file} → {md_name}")
             except Exception as e:
                 print(f"❌ 轉換失敗: {file}，原因: {e}")
@@ -128,5 +206,6 @@ def batch_convert(input_folder, output_folder):
 if __name__ == "__main__":
     input_dir = "laws"     # 輸入資料夾 (放 XML)
     output_dir = "laws_md"     # 輸出資料夾 (存放 Markdown)
-    batch_convert(input_dir, output_dir)
+    streaming = "--stream" in sys.argv   # 超大 XML：python md.py --stream
+    batch_convert(input_dir, output_dir, streaming=streaming)
     print("🎉 全部轉換完成！")
@@ -0,0 +1,101 @@
+import json
+import operator
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# ================== Metadata 篩選 ==================
+# 已知相關條例時，檢索只在指定的 Cap / 條號範圍內進行：
+#   - build_where：組成 Chroma collection.query 的 where（$in / $gte / $lte / $and）
+#   - MetadataColumns：量化向量庫 / FAISS 用同一個 where 算出 row mask；
+#     每個 metadata 欄位只讀一次成一欄，常用的 where 的 mask 也會快取
+# 只支援本專案用到的運算子：欄位等於、$eq、$ne、$in、$nin、$gt、$gte、$lt、$lte，以及 $and / $or。
+# 大小比較只對數值欄位成立（與 Chroma 相同），沒有條號的條文不會落在任何範圍內。
+
+_ORDER_OPS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def build_where(caps=None, sections=None):
+    """caps：Cap 編號 list（例如 ["4", "4A"]）；sections：(起, 訖) 條號範圍，含兩端，任一端可為 None
+
+    沒有任何條件時回傳 None（不篩選）。
+    """
+    clauses = []
+    if caps:
+        caps = [str(c) for c in caps]
+        clauses.append({"cap_number": caps[0]} if len(caps) == 1 else {"cap_number": {"$in": caps}})
+    if sections:
+        lo, hi = sections
+        if lo is not None:
+            clauses.append({"section_num": {"$gte": int(lo)}})
+        if hi is not None:
+            clauses.append({"section_num": {"$lte": int(hi)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _matches(value, op, target):
+    if op == "$eq":
+        return value == target
+    if op == "$ne":
+        return value != target
+    if op == "$in":
+        return value in target
+    if op == "$nin":
+        return value not in target
+    if op not in _ORDER_OPS:
+        raise ValueError(f"❌ 不支援的 where 運算子: {op}")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return _ORDER_OPS[op](value, target)
+
+
+def where_mask(where, column):
+    """column(field) → 該欄所有 row 的值（list）；回傳 bool[N]"""
+    masks = []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            subs = [where_mask(w, column) for w in cond]
+            masks.append(np.logical_and.reduce(subs) if key == "$and" else np.logical_or.reduce(subs))
+            continue
+        values = column(key)
+        conditions = cond if isinstance(cond, dict) else {"$eq": cond}
+        for op, target in conditions.items():
+            masks.append(np.fromiter((_matches(v, op, target) for v in values), dtype=bool, count=len(values)))
+    return np.logical_and.reduce(masks)
+
+
+class MetadataColumns:
+    """read_column(field) 回傳該欄所有 row 的值；欄位與 mask 都快取在記憶體"""
+
+    def __init__(self, read_column, max_masks=64):
+        self.read_column = read_column
+        self.max_masks = max_masks
+        self._columns = {}
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def column(self, field):
+        with self._lock:
+            values = self._columns.get(field)
+        if values is None:
+            values = self.read_column(field)
+            with self._lock:
+                self._columns[field] = values
+        return values
+
+    def rows(self, where):
+        """符合 where 的 row ids（遞增）"""
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        with self._lock:
+            rows = self._masks.get(key)
+            if rows is not None:
+                self._masks.move_to_end(key)
+                return rows
+        rows = np.flatnonzero(where_mask(where, self.column))
+        with self._lock:
+            self._masks[key] = rows
+            while len(self._masks) > self.max_masks:
+                self._masks.popitem(last=False)
+        return rows
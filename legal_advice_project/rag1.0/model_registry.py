@@ -0,0 +1,80 @@
+import threading
+from onnx_embedding import load_encoder, resolve_backend
+
+# ================== 模型登記處 ==================
+# 同一 process 內的 embedding 模型與 reranker 只載入一次，各模組共用：
+#   - get_encoder：gte-large-zh 等 embedding 模型（torch / onnx / onnx-int8；workers > 1 時為 EmbeddingPool）
+#   - get_cross_encoder：CrossEncoder（bge-reranker-large、cascade 用的 bge-reranker-base）
+#   - get_reranker：bge-reranker-large 包上微批次與分數快取（見 rerank_service.py）
+#   - get_embedding_function：經 embedding 快取的 GTEEmbeddingFunction，可同時給多個 Chroma collection 用
+# 第一次取用時才載入；之後不論哪個模組、建立幾個 embedding function，拿到的都是同一份模型。
+
+DEFAULT_EMBEDDING_MODEL = "thenlper/gte-large-zh"
+DEFAULT_RERANKER_MODEL = "BAAI/bge-reranker-large"
+
+_models = {}
+_lock = threading.RLock()   # 建立 reranker / embedding function 時會再取用底層模型
+
+
+def _shared(key, factory):
+    model = _models.get(key)
+    if model is None:
+        # 載入期間持有鎖：並發的第一次取用只會載入一份
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = factory()
+    return model
+
+
+def get_encoder(model_name=DEFAULT_EMBEDDING_MODEL, backend=None, workers=None, threads_per_worker=None):
+    """有 encode() 的 embedding 模型；backend 預設讀 EMBEDDING_BACKEND"""
+    backend = resolve_backend(backend)
+    if workers and workers > 1:
+        from embedding_pool import EmbeddingPool
+
+        return _shared(("pool", model_name, backend, workers, threads_per_worker),
+                       lambda: EmbeddingPool(model_name, workers, threads_per_worker, backend=backend))
+
+    def load():
+        print(f"📥 載入本地模型 {model_name}（{backend}）...")
+        return load_encoder(model_name, backend)
+
+    return _shared(("encoder", model_name, backend), load)
+
+
+def get_cross_encoder(model_name=DEFAULT_RERANKER_MODEL):
+    def load():
+        from sentence_transformers import CrossEncoder
+
+        print(f"📥 載入 reranker {model_name} ...")
+        return CrossEncoder(model_name)
+
+    return _shared(("cross-encoder", model_name), load)
+
+
+def get_reranker(model_name=DEFAULT_RERANKER_MODEL):
+    """微批次 + 分數快取的 reranker；並發的請求共用同一個背景 thread 與模型"""
+    def build():
+        from rerank_service import BatchingReranker, ScoreCachingReranker
+
+        return ScoreCachingReranker(BatchingReranker(get_cross_encoder(model_name)))
+
+    return _shared(("reranker", model_name), build)
+
+
+def get_embedding_function(model_name=DEFAULT_EMBEDDING_MODEL, backend=None):
+    """經 embedding 快取的 GTEEmbeddingFunction（Chroma embedding_function 介面）"""
+    def build():
+        from contract_ingest import GTEEmbeddingFunction
+        from embedding_cache import with_embedding_cache
+
+        return with_embedding_cache(GTEEmbeddingFunction(model_name, backend=backend))
+
+    return _shared(("embedding-function", model_name, resolve_backend(backend)), build)
+
+
+def loaded():
+    """已載入的模型（供監控 / 除錯）"""
+    with _lock:
+        return [":".join(str(part) for part in key if part is not None) for key in _models]
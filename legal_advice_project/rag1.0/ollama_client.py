@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# ================== Ollama client ==================
+# launcher、兩個 Web UI 與批次工作共用的 Ollama 呼叫：
+#   - 一個 requests.Session（keep-alive 連線池），不必每次重新建立 TCP 連線
+#   - connect / read timeout 分開設定；read timeout 涵蓋整個生成時間
+#   - 連線失敗、連線逾時與 429 / 5xx 以指數退避重試；生成途中的 read timeout 不重試（重跑只會再等一次）
+#   - 每種任務有 num_predict 上限（TASK_BUDGETS），生成長度不會無上限
+#   - num_ctx 所有任務共用同一個值：同一模型的 num_ctx 一改變，Ollama 就會重新載入模型
+#   - generate_stream 逐段讀 Ollama 的 NDJSON 串流，並記錄首個 token 延遲（TTFT）；
+#     串流時 read timeout 是「兩段之間」的上限，而非整個生成時間
+# 參數可由環境變數 OLLAMA_HOST / OLLAMA_CONNECT_TIMEOUT / OLLAMA_READ_TIMEOUT / OLLAMA_RETRIES / OLLAMA_NUM_CTX 設定。
+
+DEFAULT_HOST = "http://localhost:11434"
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 300
+DEFAULT_RETRIES = 3
+DEFAULT_NUM_CTX = 8192
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 各任務的生成長度上限（token）
+TASK_BUDGETS = {
+    "clause": {"num_predict": 512},    # 單一條款分析
+    "summary": {"num_predict": 600},   # 合約摘要
+    "risks": {"num_predict": 600},     # 風險重點
+    "law": {"num_predict": 512},       # 法律問題（RAG）
+    "verify": {"num_predict": 700},    # 第二個 LLM 複核
+    "default": {"num_predict": 500},
+}
+
+
+class OllamaError(RuntimeError):
+    pass
+
+
+def _base_url(host):
+    host = host.rstrip("/")
+    return host if host.startswith(("http://", "https://")) else f"http://{host}"
+
+
+class OllamaClient:
+    def __init__(self, host=None, connect_timeout=None, read_timeout=None, retries=None, backoff=0.5,
+                 num_ctx=None, pool_size=8):
+        self.base_url = _base_url(host or os.getenv("OLLAMA_HOST", DEFAULT_HOST))
+        self.connect_timeout = connect_timeout or float(os.getenv("OLLAMA_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT))
+        self.read_timeout = read_timeout or float(os.getenv("OLLAMA_READ_TIMEOUT", DEFAULT_READ_TIMEOUT))
+        self.retries = retries if retries is not None else int(os.getenv("OLLAMA_RETRIES", DEFAULT_RETRIES))
+        self.backoff = backoff
+        self.num_ctx = num_ctx or int(os.getenv("OLLAMA_NUM_CTX", DEFAULT_NUM_CTX))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.streams = 0
+        self.ttft_ms_total = 0.0
+
+    def budget(self, task="default", num_predict=None):
+        """任務的 options：num_predict 取任務上限與呼叫端要求的較小者"""
+        limit = TASK_BUDGETS.get(task, TASK_BUDGETS["default"])["num_predict"]
+        return {"num_predict": min(num_predict, limit) if num_predict else limit, "num_ctx": self.num_ctx}
+
+    def _request(self, method, path, timeout=None, **kwargs):
+        """送出請求；可重試的錯誤以 backoff * 2^n 秒退避，用完次數後拋出 OllamaError"""
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            with self._stats_lock:
+                self.requests += 1
+                self.retried += attempt > 0
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.ConnectTimeout) as e:
+                error = e
+            except requests.RequestException as e:
+                self._failed()
+                raise OllamaError(f"Ollama 請求失敗: {e}") from e
+            else:
+                if resp.status_code < 400:
+                    return resp
+                error = OllamaError(f"Ollama 回應 {resp.status_code}: {resp.text[:500]}")
+                if resp.status_code not in RETRY_STATUS:
+                    self._failed()
+                    raise error
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        self._failed()
+        raise OllamaError(f"Ollama 請求失敗（已重試 {self.retries} 次）: {error}") from error
+
+    def _failed(self):
+        with self._stats_lock:
+            self.failures += 1
+
+    def generate(self, model, prompt, task="default", num_predict=None, temperature=0.3, **options):
+        """非串流生成，回傳完整回應文字"""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "options": {"temperature": temperature, **self.budget(task, num_predict), **options},
+            "stream": False,
+        }
+        resp = self._request("POST", "/api/generate", json=payload)
+        return resp.json().get("response", "").strip()
+
+    def generate_stream(self, model, prompt, task="default", num_predict=None, temperature=0.3, timings=None,
+                        **options):
+        """串流生成：逐段 yield 文字；timings（dict）會填入 ttft_ms / total_ms / chunks
+
+        連線階段的錯誤照常重試；開始收到內容後出錯則拋出 OllamaError（已輸出的部份無法收回）。
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "options": {"temperature": temperature, **self.budget(task, num_predict), **options},
+            "stream": True,
+        }
+        timings = timings if timings is not None else {}
+        chunks = 0
+        t0 = time.perf_counter()
+        try:
+            # 連線失敗（例如模型未下載的 404、Ollama 未啟動）也要記下 total_ms / chunks
+            resp = self._request("POST", "/api/generate", json=payload, stream=True)
+            with resp:
+                # chunk_size=None：Ollama 以 chunked encoding 送出，每收到一段就處理（預設 512 bytes 會等湊滿才交出）
+                for line in resp.iter_lines(chunk_size=None):
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        self._failed()
+                        raise OllamaError(f"Ollama 串流錯誤: {data['error']}")
+                    piece = data.get("response", "")
+                    if piece:
+                        if chunks == 0:
+                            timings["ttft_ms"] = (time.perf_counter() - t0) * 1000
+                            with self._stats_lock:
+                                self.streams += 1
+                                self.ttft_ms_total += timings["ttft_ms"]
+                        chunks += 1
+                        yield piece
+                    if data.get("done"):
+                        break
+        except (requests.RequestException, ValueError) as e:
+            self._failed()
+            raise OllamaError(f"Ollama 串流中斷: {e}") from e
+        finally:
+            timings["total_ms"] = (time.perf_counter() - t0) * 1000
+            timings["chunks"] = chunks
+
+    def list_models(self, timeout=2):
+        resp = self._request("GET", "/api/tags", timeout=timeout)
+        return [m["name"] for m in resp.json().get("models", [])]
+
+    def is_ready(self, timeout=2):
+        """Ollama API 是否可用（不重試，供啟動時輪詢）"""
+        try:
+            return self.session.get(f"{self.base_url}/api/tags", timeout=timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def stats(self):
+        with self._stats_lock:
+            return {"requests": self.requests, "retried": self.retried, "failures": self.failures,
+                    "streams": self.streams,
+                    "avg_ttft_ms": round(self.ttft_ms_total / self.streams, 1) if self.streams else None,
+                    "num_ctx": self.num_ctx, "base_url": self.base_url}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """同一 process 共用的 OllamaClient（連線池也共用）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
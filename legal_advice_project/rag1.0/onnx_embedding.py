@@ -0,0 +1,236 @@
+import os
+import json
+import argparse
+import numpy as np
+import onnxruntime as ort
+from tokenizers import Tokenizer
+
+# ================== ONNX Runtime embedding ==================
+# 在純 CPU 機器上取代 PyTorch 的 SentenceTransformer：
+#   - export_onnx() 把 SentenceTransformer 的 transformer 部分匯出成 ONNX（可再做 int8 動態量化），
+#     pooling 方式 / 是否正規化 / 最大長度從原模型讀出，存在 st_config.json
+#   - OnnxEncoder 只需要 onnxruntime + tokenizers，encode() 與 SentenceTransformer.encode 回傳相同格式
+#   - verify() 以 PyTorch 版本為準，檢查 cosine 相似度與近鄰排序是否在容許範圍內
+# BGEEmbeddingFunction / GTEEmbeddingFunction 以 backend="onnx" / "onnx-int8"（或環境變數
+# EMBEDDING_BACKEND）選用；第一次使用時自動匯出到 ./onnx_models/<模型名稱>/。
+#
+# 用法：python onnx_embedding.py --model thenlper/gte-large-zh --int8 --verify
+
+DEFAULT_ONNX_DIR = "./onnx_models"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# 與 PyTorch 版本相比，每條文字 embedding 的最低 cosine 相似度
+MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+
+VERIFY_TEXTS = [
+    "任何條例中凡提述總督之處，須解釋為提述行政長官。",
+    "本條例的條文須當作補救性的條文，並須予以公正、廣義及自由的解釋。",
+    "凡條例授權訂立附屬法例，該附屬法例須在憲報刊登。",
+    "租客須於每月首日繳交租金，逾期七日未繳者，業主可終止租約。",
+    "乙方未經甲方書面同意，不得將本合約項下的權利轉讓予第三方。",
+    "本合約受香港特別行政區法律管轄，雙方同意接受香港法院的非專屬司法管轄。",
+    "僱主須於僱傭合約終止時，向僱員支付代通知金及未放取的年假薪酬。",
+    "保密資料不包括在披露時已屬公眾所知的資料。",
+]
+
+
+def model_dir(model_name, onnx_dir=None):
+    return os.path.join(onnx_dir or DEFAULT_ONNX_DIR, model_name.replace("/", "__"))
+
+
+def resolve_backend(backend=None):
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"❌ 不支援的 embedding backend: {backend}（可選 {', '.join(BACKENDS)}）")
+    return backend
+
+
+# ================== 匯出 ==================
+def export_onnx(model_name, onnx_dir=None, int8=False, opset=14):
+    """匯出 ONNX 模型與 tokenizer；int8=True 時另外產生動態量化的 model.int8.onnx"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    out_dir = model_dir(model_name, onnx_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+
+    if not os.path.exists(fp32_path):
+        print(f"📦 匯出 {model_name} 為 ONNX ...")
+        st_model = SentenceTransformer(model_name, device="cpu")
+        pooling = next(m for m in st_model if isinstance(m, Pooling))
+        config = {
+            "model_name": model_name,
+            "pooling": pooling.get_pooling_mode_str(),
+            "normalize": any(isinstance(m, Normalize) for m in st_model),
+            "max_seq_length": st_model.max_seq_length,
+        }
+        tokenizer = st_model.tokenizer
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                       if name in tokenizer.model_input_names]
+
+        class _Encoder(torch.nn.Module):
+            # 只輸出 last_hidden_state，pooling 在 numpy 做
+            def __init__(self, transformer):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, *inputs):
+                return self.transformer(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+        dummy = tokenizer(["法律條文"], return_tensors="pt")
+        encoder = _Encoder(st_model[0].auto_model).eval()
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(encoder, tuple(dummy[name] for name in input_names), fp32_path,
+                              input_names=input_names, output_names=["last_hidden_state"],
+                              dynamic_axes=dynamic_axes, opset_version=opset, dynamo=False)
+        tokenizer.save_pretrained(out_dir)   # 產生 tokenizer.json，執行時只需 tokenizers
+        with open(os.path.join(out_dir, "st_config.json"), "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    if int8 and not os.path.exists(int8_path):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            raise ImportError("❌ int8 量化需要 onnx 套件：pip install onnx") from e
+        print("📦 產生 int8 動態量化模型 ...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return out_dir
+
+
+# ================== 推論 ==================
+class OnnxEncoder:
+    """與 SentenceTransformer.encode 相容的 ONNX Runtime 推論"""
+
+    def __init__(self, path, int8=False, num_threads=None):
+        with open(os.path.join(path, "st_config.json"), encoding="utf-8") as f:
+            self.config = json.load(f)
+        if self.config["pooling"] not in ("mean", "cls", "max"):
+            raise ValueError(f"❌ ONNX backend 不支援 pooling 方式: {self.config['pooling']}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        num_threads = num_threads or int(os.getenv("ORT_NUM_THREADS", "0"))
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_file = "model.int8.onnx" if int8 else "model.onnx"
+        self.session = ort.InferenceSession(os.path.join(path, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.no_padding()   # 每批自行補齊到該批最長
+
+    @classmethod
+    def load(cls, model_name, int8=False, onnx_dir=None, **kwargs):
+        """載入已匯出的模型；不存在時先匯出"""
+        path = model_dir(model_name, onnx_dir)
+        model_file = "model.int8.onnx" if int8 else "model.onnx"
+        if not os.path.exists(os.path.join(path, model_file)):
+            export_onnx(model_name, onnx_dir, int8=int8)
+        print(f"📥 載入 ONNX 模型 {path}/{model_file} ...")
+        return cls(path, int8=int8, **kwargs)
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        max_len = max(len(e.ids) for e in encodings)
+        ids = np.zeros((len(texts), max_len), dtype=np.int64)
+        mask = np.zeros((len(texts), max_len), dtype=np.int64)
+        type_ids = np.zeros((len(texts), max_len), dtype=np.int64)
+        for i, e in enumerate(encodings):
+            ids[i, :len(e.ids)] = e.ids
+            mask[i, :len(e.ids)] = 1
+            type_ids[i, :len(e.ids)] = e.type_ids
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": type_ids}
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+
+        pooling = self.config["pooling"]
+        if pooling == "cls":
+            pooled = hidden[:, 0]
+        elif pooling == "max":
+            pooled = np.where(mask[..., None] > 0, hidden, -1e9).max(axis=1)
+        else:
+            pooled = (hidden * mask[..., None]).sum(axis=1) / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        """回傳 float32[N, D]；按長度排序後分批，減少 padding"""
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size=batch_size)[0]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            for i, vec in zip(idx, self._encode_batch([texts[i] for i in idx])):
+                out[i] = vec
+        return np.stack(out)
+
+
+def load_encoder(model_name, backend=None):
+    """依 backend 回傳 SentenceTransformer 或 OnnxEncoder（兩者的 encode() 相容）"""
+    backend = resolve_backend(backend)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    return OnnxEncoder.load(model_name, int8=backend == "onnx-int8")
+
+
+# ================== 容許誤差檢查 ==================
+def verify(model_name, backend="onnx", texts=None, k=3):
+    """與 PyTorch 版本比較：每條文字的 cosine 相似度，以及以每條文字為查詢時 top-k 近鄰的重疊率"""
+    from sentence_transformers import SentenceTransformer
+
+    texts = texts or VERIFY_TEXTS
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    candidate = load_encoder(model_name, backend).encode(texts)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+
+    cosines = (reference * candidate).sum(axis=1)
+    k = min(k, len(texts) - 1)
+    overlaps = []
+    for i in range(len(texts)):
+        ref_rank = [j for j in np.argsort(-(reference @ reference[i])) if j != i][:k]
+        cand_rank = [j for j in np.argsort(-(candidate @ candidate[i])) if j != i][:k]
+        overlaps.append(len(set(ref_rank) & set(cand_rank)) / k)
+
+    report = {
+        "model": model_name, "backend": backend, "n_texts": len(texts),
+        "min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean()),
+        "required_min_cosine": MIN_COSINE[backend], f"top{k}_overlap": float(np.mean(overlaps)),
+    }
+    report["passed"] = report["min_cosine"] >= MIN_COSINE[backend]
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="thenlper/gte-large-zh")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--int8", action="store_true", help="同時產生 int8 動態量化模型")
+    parser.add_argument("--verify", action="store_true", help="匯出後與 PyTorch 版本比較誤差")
+    parser.add_argument("--texts-file", default=None, help="驗證用文字（每行一條），預設為內建範例")
+    args = parser.parse_args()
+
+    DEFAULT_ONNX_DIR = args.onnx_dir
+    print(f"✅ 已匯出到 {export_onnx(args.model, args.onnx_dir, int8=args.int8)}")
+    if args.verify:
+        texts = None
+        if args.texts_file:
+            with open(args.texts_file, encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        failed = False
+        for backend in (["onnx", "onnx-int8"] if args.int8 else ["onnx"]):
+            report = verify(args.model, backend, texts)
+            print(json.dumps(report, ensure_ascii=False))
+            failed = failed or not report["passed"]
+        if failed:
+            raise SystemExit("❌ ONNX 輸出超出容許誤差")
+        print("✅ ONNX 輸出在容許誤差內")
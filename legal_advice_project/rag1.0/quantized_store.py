@@ -0,0 +1,209 @@
+import os
+import json
+import mmap
+import shutil
+import numpy as np
+from metadata_filter import MetadataColumns
+
+# ================== 量化向量庫 ==================
+# 法律條文向量的省記憶體存法（取代 Chroma 的 float32 向量）：
+#   - int8：每個維度一個 scale 的對稱純量量化，每個向量 D bytes（float32 的 1/4）
+#   - float16：每個向量 2D bytes（float32 的 1/2）
+# 查詢時先用量化向量在記憶體內算近似相似度，取前 n_results * rescore_factor 個候選，
+# 再從磁碟上（mmap）的 float32 原始向量為這些候選精確重算分數。
+# query() 的參數與回傳格式與 Chroma collection.query 相同（包括 where 篩選），hybrid_search 可直接替換。
+# 有 where 時只為符合的 row 計分，篩得越窄查詢越快。
+#
+# 目錄格式：
+#   meta.json        dtype / 維度 / 筆數 / 模型名稱
+#   codes.npy        int8[N, D] 或 float16[N, D]（常駐記憶體）
+#   scales.npy       float32[D]（只有 int8）
+#   full.npy         float32[N, D]，已正規化的原始向量（mmap，只讀候選列）
+#   docs.jsonl       每行 {"id", "document", "metadata"}，按需讀取
+#   doc_offsets.npy  int64[N+1]
+
+FORMAT_VERSION = 1
+QUANT_DTYPES = ("int8", "float16")
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class QuantizedVectorStore:
+    def __init__(self, path, embedding_function=None, rescore_factor=4, block_rows=4096):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"❌ 不支援的量化向量庫格式: {self.meta.get('format')}")
+        self.path = path
+        self.dtype = self.meta["dtype"]
+        self.embedding_function = embedding_function
+        self.rescore_factor = rescore_factor
+        self.block_rows = block_rows
+
+        self.codes = np.load(os.path.join(path, "codes.npy"))   # 量化向量常駐記憶體
+        scales_path = os.path.join(path, "scales.npy")
+        self.scales = np.load(scales_path) if self.dtype == "int8" else None
+        self.full = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+        self._doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "docs.jsonl"), "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.meta["count"] else b""
+        self.columns = MetadataColumns(
+            lambda field: [(self.row(i)["metadata"] or {}).get(field) for i in range(self.count())]
+        )
+
+    @classmethod
+    def load(cls, path="./law_vectors", embedding_function=None, **kwargs):
+        return cls(path, embedding_function=embedding_function, **kwargs)
+
+    def close(self):
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+        self.full = None
+        self._doc_offsets = None
+
+    def count(self):
+        return self.meta["count"]
+
+    def memory_bytes(self):
+        """常駐記憶體的向量大小（不含 mmap 的 float32 原始向量）"""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    # ---------- 文件 ----------
+    def row(self, i):
+        start, end = int(self._doc_offsets[i]), int(self._doc_offsets[i + 1])
+        return json.loads(self._docs[start:end].decode("utf-8"))
+
+    def iter_rows(self):
+        for i in range(self.count()):
+            yield i, self.row(i)
+
+    def content_hashes(self):
+        """id → content_hash，供增量入庫比對"""
+        return {r["id"]: (r["metadata"] or {}).get("content_hash", "") for _, r in self.iter_rows()}
+
+    # ---------- 查詢 ----------
+    def _approx_scores(self, query, rows=None):
+        """量化向量的近似 cosine 相似度（rows 為 None 時是全部 row）；分塊轉換，避免一次把整個矩陣轉成 float32"""
+        q = query * self.scales if self.scales is not None else query
+        q = q.astype(np.float32)
+        n = self.count() if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.block_rows):
+            index = slice(start, start + self.block_rows) if rows is None else rows[start:start + self.block_rows]
+            block = self.codes[index].astype(np.float32)
+            scores[start:start + len(block)] = block @ q
+        return scores
+
+    def search(self, query_embedding, n_results=10, rescore=True, where=None):
+        """回傳 (row ids, cosine 相似度)，分數由高到低；where 與 Chroma 相同，只在符合的 row 內搜尋"""
+        rows = None if where is None else self.columns.rows(where)
+        n = self.count() if rows is None else len(rows)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        approx = self._approx_scores(query, rows)
+
+        n_cand = min(n, n_results * self.rescore_factor if rescore else n_results)
+        pos = np.argpartition(-approx, n_cand - 1)[:n_cand] if n_cand < n else np.arange(n)
+        if rescore:
+            pos = np.sort(pos)   # rows 是遞增的，依序讀 mmap 較快
+        cand = pos if rows is None else rows[pos]
+        # rescore 時只為候選讀取 float32 原始向量精確重算
+        scores = np.asarray(self.full[cand]) @ query if rescore else approx[pos]
+        order = np.argsort(-scores, kind="stable")[:n_results]
+        return cand[order], scores[order]
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10,
+              include=("documents", "metadatas", "distances"), where=None, rescore=True):
+        """與 Chroma collection.query 相同的介面；distances 為 cosine 距離（1 - 相似度）"""
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in query_embeddings:
+            rows, scores = self.search(q, n_results=n_results, rescore=rescore, where=where)
+            records = [self.row(int(i)) for i in rows]
+            result["ids"].append([r["id"] for r in records])
+            result["documents"].append([r["document"] for r in records])
+            result["metadatas"].append([r["metadata"] for r in records])
+            result["distances"].append([float(1 - s) for s in scores])
+        return {k: v for k, v in result.items() if k == "ids" or k in include}
+
+
+class QuantizedStoreWriter:
+    """逐筆寫入新的量化向量庫（先寫到 path.tmp，finish() 時才替換舊目錄）
+
+    float32 向量先順序寫到暫存檔，finish() 時再分塊計算 scale 與量化，
+    入庫過程中不需把所有向量放在記憶體。
+    """
+
+    def __init__(self, path="./law_vectors", dtype="int8", model_name=""):
+        if dtype not in QUANT_DTYPES:
+            raise ValueError(f"❌ 不支援的量化格式: {dtype}（可選 {', '.join(QUANT_DTYPES)}）")
+        self.path = path
+        self.dtype = dtype
+        self.model_name = model_name
+        self.tmp_path = path + ".tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self._raw = open(os.path.join(self.tmp_path, "full.raw"), "wb")
+        self._docs = open(os.path.join(self.tmp_path, "docs.jsonl"), "wb")
+        self._doc_offsets = [0]
+        self.dim = None
+        self.count = 0
+
+    def add(self, ids, documents, metadatas, embeddings):
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._raw.write(vectors.tobytes())
+        for chunk_id, doc, meta in zip(ids, documents, metadatas):
+            line = (json.dumps({"id": chunk_id, "document": doc, "metadata": meta},
+                               ensure_ascii=False) + "\n").encode("utf-8")
+            self._docs.write(line)
+            self._doc_offsets.append(self._doc_offsets[-1] + len(line))
+        self.count += len(ids)
+
+    def finish(self, block_rows=65536):
+        self._raw.close()
+        self._docs.close()
+        dim = self.dim or 0
+        raw_path = os.path.join(self.tmp_path, "full.raw")
+        raw = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(self.count, dim)) if self.count else \
+            np.zeros((0, dim), dtype=np.float32)
+
+        full = np.lib.format.open_memmap(os.path.join(self.tmp_path, "full.npy"), mode="w+",
+                                         dtype=np.float32, shape=(self.count, dim))
+        max_abs = np.zeros(dim, dtype=np.float32)
+        for start in range(0, self.count, block_rows):
+            block = raw[start:start + block_rows]
+            full[start:start + len(block)] = block
+            max_abs = np.maximum(max_abs, np.abs(block).max(axis=0))
+        full.flush()
+
+        codes = np.lib.format.open_memmap(os.path.join(self.tmp_path, "codes.npy"), mode="w+",
+                                          dtype=np.int8 if self.dtype == "int8" else np.float16,
+                                          shape=(self.count, dim))
+        scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        for start in range(0, self.count, block_rows):
+            block = full[start:start + block_rows]
+            if self.dtype == "int8":
+                codes[start:start + len(block)] = np.clip(np.rint(block / scales), -127, 127)
+            else:
+                codes[start:start + len(block)] = block
+        codes.flush()
+        del full, codes, raw
+        if self.dtype == "int8":
+            np.save(os.path.join(self.tmp_path, "scales.npy"), scales)
+        os.remove(raw_path)
+
+        np.save(os.path.join(self.tmp_path, "doc_offsets.npy"), np.asarray(self._doc_offsets, dtype=np.int64))
+        with open(os.path.join(self.tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": FORMAT_VERSION, "dtype": self.dtype, "dim": dim,
+                       "count": self.count, "model": self.model_name}, f)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
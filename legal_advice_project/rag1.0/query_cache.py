@@ -0,0 +1,118 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from embedding_cache import normalize_text
+
+# ================== 查詢結果快取 ==================
+# 常見問題（例如僱傭通知期、身份證規定）重複出現時，不必再跑 embedding / 向量庫 / BM25 / reranker：
+#   - key = (正規化後的問題, 檢索參數)
+#   - LRU 上限 max_entries，每筆 ttl 秒後過期
+#   - version_fn 回傳目前索引版本；版本改變（重新入庫）時整個快取清空，
+#     舊版本開始計算、新版本才算完的結果也不會寫入（get_or_compute）
+#   - stats() 回傳命中 / 未命中 / 淘汰次數
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 6 * 3600
+
+
+def normalize_query(query):
+    return normalize_text(query).casefold()
+
+
+def file_version(*paths):
+    """以檔案的修改時間與大小組成版本字串（檔案不存在時為 missing）"""
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{path}:missing")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class QueryCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, version_fn=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_fn = version_fn or (lambda: "")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        """索引版本改變時清空快取；回傳目前版本"""
+        version = self.version_fn()
+        if version != self._version:
+            if self._version is not None:
+                self._entries.clear()
+                self.invalidations += 1
+            self._version = version
+        return version
+
+    def key(self, query, **params):
+        return (normalize_query(query), tuple(sorted(params.items())))
+
+    def get(self, query, **params):
+        key = self.key(query, **params)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]   # 已過期
+            self.misses += 1
+            return None
+
+    def put(self, query, value, **params):
+        self._store(self.key(query, **params), value)
+
+    def _store(self, key, value, version=None):
+        """寫入快取；version 不是 None 且與目前版本不同時不寫入，回傳是否已寫入"""
+        with self._lock:
+            if self._check_version() != version and version is not None:
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def get_or_compute(self, query, compute, cacheable=None, **params):
+        """回傳 (結果, 是否命中)；未命中時呼叫 compute() 並存入快取
+
+        空結果不快取；cacheable() 回傳 False 時（例如某一路檢索逾時、只拿到部份結果）也不快取。
+        """
+        version = self.version_fn()   # compute() 期間若重新入庫，結果屬於舊版本，不寫入
+        value = self.get(query, **params)
+        if value is not None:
+            return value, True
+        value = compute()
+        if value and (cacheable is None or cacheable()):
+            self._store(self.key(query, **params), value, version)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations,
+                "index_version": self._version,
+            }
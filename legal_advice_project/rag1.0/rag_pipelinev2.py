@@ -1,9 +1,10 @@
 import os
 from dotenv import load_dotenv
-from sentence_transformers import CrossEncoder
 import re
 from vertexai import rag
 from vertexai.generative_models import Tool, GenerativeModel
+from retrieval_engine import dedupe, rerank
+from model_registry import get_reranker
 
 # ================== 環境變數 ==================
 load_dotenv()
@@ -52,7 +53,9 @@ gen_model_reviewer = GenerativeModel(
 )
 
 # ================== 初始化 reranker ==================
-reranker = CrossEncoder("BAAI/bge-reranker-large")
+# 並發請求的 (query, 條文) 對在短時間窗內合併成一個 batch 再送進 cross-encoder；
+# 已算過的 (問題, 條文) 分數直接取快取；模型由 model_registry 共用，同一 process 只載入一次
+reranker = get_reranker()
 
 # ================== RAG 檢索 + rerank ==================
 def rag_search_with_rerank(query: str, n=10, top_k=3):
@@ -67,15 +70,8 @@ def rag_search_with_rerank(query: str, n=10, top_k=3):
         for ctx in rag_response.contexts.contexts[:n]:
             candidates.append((ctx.text, {"law_name": "RAG"}, ctx.score, "VertexRAG"))
 
-    if not candidates:
-        return []
-
-    # rerank
-    pairs = [(query, doc) for doc, _, _, _ in candidates]
-    scores = reranker.predict(pairs)
-    ranked = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
-
-    return ranked[:top_k]
+    # 同一段內容可能從不同檔案被檢索到，先去重再 rerank
+    return rerank(reranker, query, dedupe(candidates), top_k=top_k)
 
 # ================== Gemini 雙層回答 ==================
 def generate_answer_with_review(query, context_texts, sources):
@@ -0,0 +1,149 @@
+import os
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from query_cache import normalize_query
+
+# ================== Reranker 微批次服務 ==================
+# 每個請求只有 10～20 對 (query, 條文)，並發時 cross-encoder 會跑很多很小的 batch，CPU 效率很差。
+# BatchingReranker 在背景 thread 收集不同請求的 pairs：
+#   - 第一個請求到達後最多再等 max_wait_ms，或湊滿 max_batch_size 對就送進模型
+#   - 一次 predict（模型內部按 batch_size 補齊 padding），再把分數按請求切回去
+# predict() 與 CrossEncoder.predict 介面相同，可直接取代 reranker 物件。
+# 參數亦可由環境變數 RERANK_MAX_BATCH / RERANK_MAX_WAIT_MS 設定。
+#
+# ScoreCachingReranker 再包一層分數快取：key 為 (正規化後的問題, 條文內容 hash)，
+# 同一 session 的追問常檢索到相同條文，只有未快取的 pairs 才送進模型。
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 5
+DEFAULT_SCORE_CACHE_ENTRIES = 50000
+
+
+class BatchingReranker:
+    def __init__(self, model, max_batch_size=None, max_wait_ms=None):
+        self.model = model
+        self.max_batch_size = max_batch_size or int(os.getenv("RERANK_MAX_BATCH", DEFAULT_MAX_BATCH))
+        wait_ms = max_wait_ms if max_wait_ms is not None else float(os.getenv("RERANK_MAX_WAIT_MS", DEFAULT_MAX_WAIT_MS))
+        self.max_wait = wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.pairs = 0
+        self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._worker.start()
+
+    def predict(self, pairs, batch_size=None, **kwargs):
+        """與 CrossEncoder.predict 相同：回傳每對的分數（numpy array）；會阻塞到所屬的批次算完"""
+        pairs = list(pairs)
+        if not pairs:
+            return np.empty(0, dtype=np.float32)
+        future = Future()
+        self._queue.put((pairs, future))
+        return future.result()
+
+    def _collect(self):
+        """阻塞等第一個請求，之後在 max_wait 內盡量多收，直到湊滿 max_batch_size"""
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            all_pairs = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                scores = np.asarray(self.model.predict(all_pairs, batch_size=self.max_batch_size,
+                                                       show_progress_bar=False))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for pairs, future in batch:
+                future.set_result(scores[start:start + len(pairs)])
+                start += len(pairs)
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.pairs += len(all_pairs)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "batches": self.batches, "requests": self.requests, "pairs": self.pairs,
+                "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "avg_pairs_per_batch": round(self.pairs / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size, "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+class ScoreCachingReranker:
+    def __init__(self, reranker, max_entries=None):
+        self.reranker = reranker
+        self.max_entries = max_entries or int(os.getenv("RERANK_SCORE_CACHE", DEFAULT_SCORE_CACHE_ENTRIES))
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query, doc):
+        return normalize_query(query), hashlib.sha1(doc.encode("utf-8")).hexdigest()
+
+    def predict(self, pairs, batch_size=None, **kwargs):
+        pairs = list(pairs)
+        keys = [self.key(q, d) for q, d in pairs]
+        scores = np.empty(len(pairs), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._scores.get(key)
+                if score is None:
+                    missing.append(i)
+                else:
+                    self._scores.move_to_end(key)
+                    scores[i] = score
+            self.hits += len(pairs) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            # 同一批內重複的 pair 只算一次
+            unique = list(dict.fromkeys(keys[i] for i in missing))
+            first = {}
+            for i in missing:
+                first.setdefault(keys[i], i)
+            new_scores = np.asarray(self.reranker.predict([pairs[first[k]] for k in unique], batch_size=batch_size))
+            by_key = dict(zip(unique, new_scores.tolist()))
+            for i in missing:
+                scores[i] = by_key[keys[i]]
+            with self._lock:
+                self._scores.update(by_key)
+                while len(self._scores) > self.max_entries:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {"entries": len(self._scores), "max_entries": self.max_entries,
+                     "hits": self.hits, "misses": self.misses,
+                     "hit_rate": round(self.hits / total, 4) if total else 0.0}
+        if hasattr(self.reranker, "stats"):
+            stats["batching"] = self.reranker.stats()
+        return stats
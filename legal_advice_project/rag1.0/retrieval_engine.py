@@ -0,0 +1,289 @@
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import numpy as np
+from metadata_filter import build_where
+
+# ================== 檢索引擎 ==================
+# Web UI / rag_pipelinev2 / app.py 共用的檢索邏輯：
+#   - top_k_indices：numpy argpartition 取前 k 名，不用排序整個分數陣列
+#   - 候選以 chunk id 去重（沒有 id 時用內容 hash），不再以整段條文字串當 key
+#   - reciprocal_rank_fusion：向量與 BM25 的分數尺度不同，只用名次融合
+#   - rerank：cross-encoder 重排序；可選兩段式（cascade）：先用輕量模型（小 cross-encoder 或
+#     embedding cosine）把候選刪減到 keep 個，只有留下的才送進 bge-reranker-large
+#   - HybridRetriever：向量與 BM25 兩路各在自己的 thread pool 上同時檢索，各有時限；
+#     其中一路逾時 / 出錯時只用另一路的結果，不拖住整個回答；一路卡住也不會佔用另一路的 thread；
+#     caps / sections 篩選同時推到向量庫的 where 與 BM25 的 per-cap postings
+# 候選格式沿用原本的 (doc, meta, score, source) tuple；rerank 回傳 [((doc, meta, score, source), rerank_score), ...]。
+
+RRF_K = 60
+
+
+def top_k_indices(scores, k):
+    """分數由高到低的前 k 個位置（O(n) 選出，只排序這 k 個）"""
+    scores = np.asarray(scores)
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def candidate_key(candidate):
+    """去重用的 key：meta 內的 id，否則為條文內容 hash"""
+    doc, meta = candidate[0], candidate[1] or {}
+    chunk_id = meta.get("id") or meta.get("chunk_id")
+    if chunk_id:
+        return str(chunk_id)
+    return hashlib.sha1(doc.encode("utf-8")).hexdigest()
+
+
+def dedupe(candidates):
+    """保留每個 key 第一次出現（名次最高）的候選"""
+    seen = set()
+    unique = []
+    for candidate in candidates:
+        key = candidate_key(candidate)
+        if key not in seen:
+            seen.add(key)
+            unique.append(candidate)
+    return unique
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K, weights=None, limit=None):
+    """RRF：score = Σ weight / (k + rank)；回傳 (doc, meta, fused_score, "來源1+來源2") 由高到低"""
+    weights = weights or [1.0] * len(ranked_lists)
+    fused = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, candidate in enumerate(dedupe(ranked), start=1):
+            key = candidate_key(candidate)
+            entry = fused.get(key)
+            if entry is None:
+                fused[key] = entry = [candidate, 0.0, []]
+            entry[1] += weight / (k + rank)
+            entry[2].append(candidate[3])
+    entries = list(fused.values())
+    order = top_k_indices([e[1] for e in entries], limit or len(entries))
+    return [(entries[i][0][0], entries[i][0][1], entries[i][1], "+".join(entries[i][2])) for i in order]
+
+
+CASCADE_KINDS = ("none", "embedding", "cross-encoder")
+
+
+class EmbeddingSimilarityScorer:
+    """以 embedding cosine 相似度為 (query, doc) 評分，介面同 CrossEncoder.predict
+
+    條文在入庫時已 embedding 過，經 embedding 快取時幾乎只需算 query 的向量。
+    """
+
+    def __init__(self, embedding_fn):
+        self.embedding_fn = embedding_fn
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        if not pairs:
+            return np.empty(0, dtype=np.float32)
+        queries = sorted({q for q, _ in pairs})
+        vectors = np.asarray(self.embedding_fn(queries + [doc for _, doc in pairs]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query_vecs = dict(zip(queries, vectors[:len(queries)]))
+        doc_vecs = vectors[len(queries):]
+        return np.array([doc_vecs[i] @ query_vecs[q] for i, (q, _) in enumerate(pairs)], dtype=np.float32)
+
+
+def build_prefilter(kind, embedding_fn=None, model_name="BAAI/bge-reranker-base"):
+    """cascade 第一段的評分器；kind 為 none / embedding / cross-encoder"""
+    if kind in (None, "none"):
+        return None
+    if kind == "embedding":
+        return EmbeddingSimilarityScorer(embedding_fn)
+    if kind == "cross-encoder":
+        from model_registry import get_cross_encoder
+        return get_cross_encoder(model_name)
+    raise ValueError(f"❌ 不支援的 cascade 方式: {kind}（可選 {', '.join(CASCADE_KINDS)}）")
+
+
+def prune(prefilter, query, candidates, keep, batch_size=32):
+    """用輕量評分器只留下前 keep 個候選（維持原本的 tuple）"""
+    if prefilter is None or len(candidates) <= keep:
+        return candidates
+    scores = np.asarray(prefilter.predict([(query, c[0]) for c in candidates], batch_size=batch_size))
+    return [candidates[i] for i in top_k_indices(scores, keep)]
+
+
+def rerank(reranker, query, candidates, top_k=3, batch_size=32, prefilter=None, keep=10):
+    """cross-encoder 重排序，回傳 [(candidate, rerank_score), ...]
+
+    prefilter 不為 None 時先以它刪減到 keep 個候選（cascade），reranker 只為留下的評分。
+    """
+    candidates = prune(prefilter, query, candidates, keep, batch_size=batch_size)
+    if not candidates:
+        return []
+    scores = np.asarray(reranker.predict([(query, c[0]) for c in candidates], batch_size=batch_size))
+    return [(candidates[i], float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+
+def context_and_sources(reranked):
+    """rerank 結果 → (條文內容 list, 來源說明 list)"""
+    context_texts = [doc for (doc, _, _, _), _ in reranked]
+    sources = [f"- {meta.get('law_name', '')} {meta.get('section', '')}" for (_, meta, _, _), _ in reranked]
+    return context_texts, sources
+
+
+class HybridRetriever:
+    """向量庫（Chroma collection / QuantizedVectorStore / FaissVectorStore）+ BM25Index，以 RRF 融合
+
+    vector_timeout / bm25_timeout 為各自的時限（秒，由查詢開始計算）；逾時的那一路結果會被捨棄，
+    背景的 thread 仍會跑完（Python 無法中斷）。每一路有自己的 pool（max_workers 個 thread）：
+    某一路已有 max_workers 個呼叫未完成時（例如 Chroma 的 sqlite 被鎖住），新查詢不再送給它，
+    直接當作逾時（timings 標記 saturated），另一路照常檢索。
+    """
+
+    def __init__(self, vector_store, bm25_index=None, tokenize=None, vector_source="Chroma", rrf_k=RRF_K,
+                 vector_timeout=3.0, bm25_timeout=1.0, max_workers=8):
+        self.vector_store = vector_store
+        self.bm25_index = bm25_index
+        if tokenize is None and bm25_index is not None:
+            from legal_tokenizer import tokenize_query
+            tokenize = tokenize_query
+        self.tokenize = tokenize
+        self.vector_source = vector_source
+        self.rrf_k = rrf_k
+        self.timeouts = {"vector": vector_timeout, "bm25": bm25_timeout}
+        self.max_workers = max_workers
+        self._executors = {name: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"retrieval-{name}")
+                           for name in self.timeouts}
+        self._stats_lock = threading.Lock()
+        self._inflight = {name: 0 for name in self.timeouts}
+        self._closed = False
+        self._stats = {name: {"calls": 0, "timeouts": 0, "saturated": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+                       for name in self.timeouts}
+
+    def vector_candidates(self, query, n=10, caps=None, sections=None):
+        kwargs = {}
+        where = build_where(caps, sections)
+        if where is not None:
+            kwargs["where"] = where
+        results = self.vector_store.query(
+            query_texts=[query],
+            n_results=n,
+            include=["documents", "metadatas", "distances"],
+            **kwargs
+        )
+        candidates = []
+        for chunk_id, doc, meta, distance in zip(results["ids"][0], results["documents"][0],
+                                                 results["metadatas"][0], results["distances"][0]):
+            candidates.append((doc, dict(meta or {}, id=chunk_id), 1 - distance, self.vector_source))
+        return candidates
+
+    def bm25_candidates(self, query, n=10, caps=None, sections=None):
+        if self.bm25_index is None:
+            return []
+        candidates = []
+        for i, score in self.bm25_index.top_k(self.tokenize(query), k=n, caps=caps, sections=sections):
+            chunk = self.bm25_index.doc(i)
+            candidates.append((chunk["text"], chunk, score, "BM25"))
+        return candidates
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        return result, (time.perf_counter() - t0) * 1000
+
+    def close(self):
+        """結束各路的 thread pool（不等仍在跑的呼叫）；之後的查詢兩路都回報 error、結果為空"""
+        self._closed = True
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+
+    def _submit(self, name, fn, *args):
+        """交給該路自己的 pool；該路已有 max_workers 個呼叫未完成、或 retriever 已 close() 時不送出，回傳 None"""
+        with self._stats_lock:
+            if self._inflight[name] >= self.max_workers:
+                return None
+            self._inflight[name] += 1
+
+        def run():
+            try:
+                return self._timed(fn, *args)
+            finally:
+                with self._stats_lock:
+                    self._inflight[name] -= 1
+
+        try:
+            return self._executors[name].submit(run)
+        except RuntimeError:
+            # 已 close()：Web UI 重新入庫換新 retriever 時，其他 session 可能仍在用舊的
+            with self._stats_lock:
+                self._inflight[name] -= 1
+            return None
+
+    def search_with_timings(self, query, n=10, limit=None, caps=None, sections=None):
+        """回傳 (候選, timings)；timings 形如
+        {"vector": {"status": "ok" | "timeout" | "error", "ms": ..., "count": ...}, "bm25": {...}, "total_ms": ...}
+
+        caps：只在這些 Cap 內檢索（例如 ["4", "4A"]）；sections：(起, 訖) 條號範圍，含兩端，任一端可為 None。
+        """
+        t0 = time.perf_counter()
+        futures = {
+            "vector": self._submit("vector", self.vector_candidates, query, n, caps, sections),
+            "bm25": self._submit("bm25", self.bm25_candidates, query, n, caps, sections),
+        }
+        results, timings = {}, {}
+        for name, future in futures.items():
+            if future is None and self._closed:
+                results[name] = []
+                timings[name] = {"status": "error", "ms": 0.0, "count": 0, "error": "retriever 已關閉"}
+                continue
+            if future is None:
+                results[name] = []
+                timings[name] = {"status": "timeout", "ms": 0.0, "count": 0, "saturated": True}
+                print(f"⚠️ {name} 檢索已有 {self.max_workers} 個呼叫未完成（可能卡住），只用另一路的結果")
+                continue
+            remaining = max(0.0, self.timeouts[name] - (time.perf_counter() - t0))
+            try:
+                results[name], ms = future.result(timeout=remaining)
+                timings[name] = {"status": "ok", "ms": round(ms, 2), "count": len(results[name])}
+            except FutureTimeout:
+                results[name] = []
+                timings[name] = {"status": "timeout", "ms": round((time.perf_counter() - t0) * 1000, 2), "count": 0}
+                print(f"⚠️ {name} 檢索超過 {self.timeouts[name]}s，只用另一路的結果")
+            except Exception as e:
+                results[name] = []
+                timings[name] = {"status": "error", "ms": round((time.perf_counter() - t0) * 1000, 2),
+                                 "count": 0, "error": str(e)}
+                print(f"⚠️ {name} 檢索失敗，只用另一路的結果: {e}")
+        self._record(timings)
+
+        candidates = reciprocal_rank_fusion([results["vector"], results["bm25"]], k=self.rrf_k, limit=limit)
+        timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        return candidates, timings
+
+    def search(self, query, n=10, limit=None, caps=None, sections=None):
+        """兩路各取 n 個候選，RRF 融合（已去重）；limit 限制回傳數量，預設全部交給 rerank"""
+        return self.search_with_timings(query, n=n, limit=limit, caps=caps, sections=sections)[0]
+
+    def _record(self, timings):
+        with self._stats_lock:
+            for name, t in timings.items():
+                stats = self._stats[name]
+                stats["calls"] += 1
+                stats["total_ms"] += t["ms"]
+                stats["max_ms"] = max(stats["max_ms"], t["ms"])
+                if t["status"] == "timeout":
+                    stats["timeouts"] += 1
+                    stats["saturated"] += t.get("saturated", False)
+                elif t["status"] == "error":
+                    stats["errors"] += 1
+
+    def stats(self):
+        """各路累計的呼叫次數、逾時 / 錯誤次數（saturated：因未完成的呼叫太多而未送出的次數）、
+        平均與最大延遲（ms），以及目前未完成的呼叫數，供監控用"""
+        with self._stats_lock:
+            return {
+                name: dict(s, avg_ms=round(s["total_ms"] / s["calls"], 2) if s["calls"] else 0.0,
+                           inflight=self._inflight[name])
+                for name, s in self._stats.items()
+            }
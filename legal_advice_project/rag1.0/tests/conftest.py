@@ -0,0 +1,5 @@
+import os
+import sys
+
+# rag1.0 的模組都是頂層 script，直接以 import query_cache 等方式使用
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+import faiss_store  # noqa: E402
+from faiss_store import FaissVectorStore, build_index, write_store  # noqa: E402
+
+DIM = 32
+
+
+def corpus(n, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    ids = [f"4_s{i}" for i in range(n)]
+    documents = [f"條文 {i}" for i in range(n)]
+    metadatas = [{"cap_number": "4" if i % 2 else "4A", "section_num": i} for i in range(n)]
+    return ids, documents, metadatas, vectors
+
+
+def exact_ids(vectors, query, k, rows=None):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    scores = normed[rows] @ (query / np.linalg.norm(query))
+    return [f"4_s{rows[i]}" for i in np.argsort(-scores)[:k]]
+
+
+@pytest.fixture(scope="module", params=["hnsw", "ivfpq"])
+def store(request, tmp_path_factory):
+    ids, documents, metadatas, vectors = corpus(600)
+    path = str(tmp_path_factory.mktemp(request.param) / "law_faiss")
+    kwargs = {"pq_m": 8, "nlist": 4} if request.param == "ivfpq" else {}
+    write_store(path, ids, documents, metadatas, vectors, kind=request.param, **kwargs)
+    # nprobe = nlist：ivfpq 掃描全部分群，只剩 PQ 的量化誤差
+    loaded = FaissVectorStore.load(path, nprobe=4)
+    yield request.param, loaded, vectors
+    loaded.close()
+
+
+def test_query_matches_chroma_format(store):
+    kind, loaded, vectors = store
+    result = loaded.query(query_embeddings=[vectors[7]], n_results=5)
+    assert set(result) == {"ids", "documents", "metadatas", "distances"}
+    assert result["ids"][0][0] == "4_s7"
+    assert result["documents"][0][0] == "條文 7"
+    assert result["metadatas"][0][0] == {"cap_number": "4", "section_num": 7}
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+
+def test_recall_against_brute_force(store):
+    kind, loaded, vectors = store
+    rng = np.random.default_rng(1)
+    hits = 0
+    for q in vectors[rng.choice(len(vectors), 20, replace=False)] + 0.1 * rng.standard_normal((20, DIM)):
+        got = loaded.query(query_embeddings=[q], n_results=10)["ids"][0]
+        hits += len(set(got) & set(exact_ids(vectors, q, 10)))
+    assert hits / 200 >= (0.95 if kind == "hnsw" else 0.5)
+
+
+def test_where_filter_only_returns_matching_rows(store):
+    kind, loaded, vectors = store
+    where = {"$and": [{"cap_number": "4A"}, {"section_num": {"$lte": 100}}]}
+    result = loaded.query(query_embeddings=[vectors[3]], n_results=10, where=where)
+    assert len(result["ids"][0]) == 10
+    assert all(m["cap_number"] == "4A" and m["section_num"] <= 100 for m in result["metadatas"][0])
+    if kind == "hnsw":   # 篩出的 row 少，直接精確計分
+        assert result["ids"][0] == exact_ids(vectors, vectors[3], 10, rows=range(0, 101, 2))
+
+
+def test_where_filter_with_no_match(store):
+    kind, loaded, vectors = store
+    result = loaded.query(query_embeddings=[vectors[0]], n_results=5, where={"cap_number": "999"})
+    assert result["ids"] == [[]]
+
+
+def test_mmap_load_matches_in_memory_load(store, tmp_path):
+    kind, loaded, vectors = store
+    in_memory = FaissVectorStore.load(loaded.path, mmap=False, nprobe=4)
+    q = vectors[:5]
+    assert np.array_equal(loaded.search(q, 10)[1], in_memory.search(q, 10)[1])
+    in_memory.close()
+
+
+def test_ivfpq_needs_enough_training_vectors():
+    vectors = corpus(2 ** faiss_store.PQ_NBITS - 1)[3]
+    with pytest.raises(ValueError, match="hnsw"):
+        build_index(vectors, kind="ivfpq", pq_m=8)
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        build_index(corpus(10)[3], kind="flat")
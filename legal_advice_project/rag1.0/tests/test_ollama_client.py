@@ -0,0 +1,67 @@
+import json
+
+from ollama_client import OllamaClient, TASK_BUDGETS
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self, chunk_size=512):
+        return iter(self.lines)
+
+    def json(self):
+        return json.loads(self.lines[-1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def capture(client):
+    """把 client._request 換成記錄 payload 的假回應"""
+    sent = []
+
+    def request(method, path, **kwargs):
+        sent.append(kwargs["json"])
+        return FakeResponse([json.dumps({"response": "好", "done": False}).encode(),
+                             json.dumps({"response": "", "done": True}).encode()])
+
+    client._request = request
+    return sent
+
+
+def test_budget_takes_smaller_of_task_limit_and_request():
+    client = OllamaClient(num_ctx=4096)
+    assert client.budget("clause", 500)["num_predict"] == 500
+    assert client.budget("clause", 5000)["num_predict"] == TASK_BUDGETS["clause"]["num_predict"]
+    assert client.budget("no-such-task")["num_predict"] == TASK_BUDGETS["default"]["num_predict"]
+
+
+def test_stream_sends_caller_max_tokens():
+    # web_contract_ui_local_cp.call_ollama 以 task= / num_predict=max_tokens 呼叫
+    client = OllamaClient(num_ctx=4096)
+    sent = capture(client)
+    assert list(client.generate_stream("m", "p", task="clause", num_predict=300, temperature=0.7)) == ["好"]
+    assert sent[0]["options"]["num_predict"] == 300
+    assert sent[0]["options"]["temperature"] == 0.7
+    assert sent[0]["stream"] is True
+
+
+def test_stream_without_max_tokens_uses_task_budget():
+    client = OllamaClient(num_ctx=4096)
+    sent = capture(client)
+    list(client.generate_stream("m", "p", task="summary"))
+    assert sent[0]["options"]["num_predict"] == TASK_BUDGETS["summary"]["num_predict"]
+
+
+def test_generate_sends_budget():
+    client = OllamaClient(num_ctx=4096)
+    sent = capture(client)
+    client.generate("m", "p", task="risks", num_predict=100)
+    assert sent[0]["options"]["num_predict"] == 100
+    assert sent[0]["stream"] is False
@@ -0,0 +1,48 @@
+from query_cache import QueryCache
+
+
+class Version:
+    def __init__(self):
+        self.value = "v1"
+
+    def __call__(self):
+        return self.value
+
+
+def test_hit_after_compute():
+    cache = QueryCache()
+    assert cache.get_or_compute("僱傭通知期", lambda: ["a"], n=10) == (["a"], False)
+    assert cache.get_or_compute("  僱傭通知期 ", lambda: ["b"], n=10) == (["a"], True)
+    assert cache.get_or_compute("僱傭通知期", lambda: ["c"], n=5) == (["c"], False)
+
+
+def test_version_change_flushes():
+    version = Version()
+    cache = QueryCache(version_fn=version)
+    cache.get_or_compute("q", lambda: ["old"])
+    version.value = "v2"
+    assert cache.get_or_compute("q", lambda: ["new"]) == (["new"], False)
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_result_computed_across_reingest_is_not_cached():
+    version = Version()
+    cache = QueryCache(version_fn=version)
+
+    def compute_during_reingest():
+        # 查詢算到一半時重新入庫：另一個請求先看到新版本、清空快取
+        version.value = "v2"
+        assert cache.get("other") is None
+        return ["stale"]
+
+    assert cache.get_or_compute("q", compute_during_reingest) == (["stale"], False)
+    assert cache.get("q") is None
+    assert cache.get_or_compute("q", lambda: ["fresh"]) == (["fresh"], False)
+    assert cache.get_or_compute("q", lambda: ["unused"]) == (["fresh"], True)
+
+
+def test_not_cacheable_results_are_not_stored():
+    cache = QueryCache()
+    assert cache.get_or_compute("q", lambda: ["partial"], cacheable=lambda: False) == (["partial"], False)
+    assert cache.get_or_compute("q", lambda: ["full"]) == (["full"], False)
+    assert cache.get_or_compute("q", lambda: ["unused"]) == (["full"], True)
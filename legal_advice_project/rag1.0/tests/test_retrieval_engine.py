@@ -0,0 +1,69 @@
+import threading
+
+import numpy as np
+
+from retrieval_engine import HybridRetriever, reciprocal_rank_fusion, top_k_indices
+
+
+class VectorStore:
+    def __init__(self, block=None):
+        self.block = block
+
+    def query(self, query_texts, n_results, include, **kwargs):
+        if self.block is not None:
+            self.block.wait()
+        return {"ids": [["v1"]], "documents": [["向量條文"]], "metadatas": [[{}]], "distances": [[0.2]]}
+
+
+class BM25:
+    def top_k(self, tokens, k, caps=None, sections=None):
+        return [(0, 3.0)]
+
+    def doc(self, i):
+        return {"id": "b1", "text": "BM25 條文"}
+
+
+def retriever(store, **kwargs):
+    return HybridRetriever(store, BM25(), tokenize=lambda q: [q], **kwargs)
+
+
+def test_top_k_indices_sorted():
+    assert list(top_k_indices(np.array([0.1, 0.9, 0.5, 0.7]), 3)) == [1, 3, 2]
+
+
+def test_rrf_dedupes_by_id():
+    a = [("x", {"id": "1"}, 0.9, "Chroma"), ("y", {"id": "2"}, 0.8, "Chroma")]
+    b = [("y", {"id": "2"}, 5.0, "BM25")]
+    fused = reciprocal_rank_fusion([a, b])
+    assert [c[1]["id"] for c in fused] == ["2", "1"]
+
+
+def test_both_backends_ok():
+    r = retriever(VectorStore())
+    candidates, timings = r.search_with_timings("q")
+    assert {c[1]["id"] for c in candidates} == {"v1", "b1"}
+    assert timings["vector"]["status"] == timings["bm25"]["status"] == "ok"
+    r.close()
+
+
+def test_hung_backend_does_not_starve_the_other():
+    block = threading.Event()
+    r = retriever(VectorStore(block), vector_timeout=0.05, max_workers=2)
+    try:
+        statuses = [r.search_with_timings("q")[1] for _ in range(4)]
+        assert [t["vector"]["status"] for t in statuses] == ["timeout"] * 4
+        assert [t["vector"].get("saturated", False) for t in statuses] == [False, False, True, True]
+        assert all(t["bm25"]["status"] == "ok" for t in statuses)
+        assert r.stats()["vector"]["inflight"] == 2
+    finally:
+        block.set()
+        r.close()
+
+
+def test_search_after_close_reports_error_without_leaking_inflight():
+    r = retriever(VectorStore())
+    r.close()
+    candidates, timings = r.search_with_timings("q")
+    assert candidates == []
+    assert timings["vector"]["status"] == timings["bm25"]["status"] == "error"
+    assert r.stats()["vector"]["inflight"] == r.stats()["bm25"]["inflight"] == 0
@@ -1,138 +1,320 @@
 import os
-import requests
+import time
+import hashlib
 import streamlit as st
 import chromadb
-from contract_ingest import load_contract, split_into_clauses, GTEEmbeddingFunction
+from contract_ingest import load_contract, split_into_clauses
 from docx import Document
 from io import BytesIO
 import json
 from datetime import datetime
-import pickle
-from rank_bm25 import BM25Okapi
-import jieba
-from sentence_transformers import SentenceTransformer, CrossEncoder
+from bm25_index import BM25Index
+from legal_tokenizer import init_jieba, tokenize_query
+from quantized_store import QuantizedVectorStore
+from retrieval_engine import CASCADE_KINDS, HybridRetriever, build_prefilter, rerank as rerank_candidates
+from query_cache import QueryCache, file_version
+from ollama_client import OllamaError, get_client as get_ollama_client
+from model_registry import get_cross_encoder, get_embedding_function, get_encoder, get_reranker
 import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--generator", type=str, default="mistral:7b-instruct")
 parser.add_argument("--verifier", type=str, default="qwen3:8b")
+parser.add_argument("--no-stream", action="store_true", help="關閉串流，等整段回答生成完才顯示")
+parser.add_argument("--vector-timeout", type=float, default=3.0, help="向量檢索時限（秒），逾時只用 BM25 結果")
+parser.add_argument("--bm25-timeout", type=float, default=1.0, help="BM25 檢索時限（秒），逾時只用向量結果")
+parser.add_argument("--cascade", choices=CASCADE_KINDS, default="none",
+                    help="rerank 前先用輕量模型刪減候選：embedding（cosine）或 cross-encoder（--cascade-model）")
+parser.add_argument("--cascade-keep", type=int, default=8, help="cascade 第一段留下的候選數")
+parser.add_argument("--cascade-model", type=str, default="BAAI/bge-reranker-base")
+parser.add_argument("--law-vectors", choices=["chroma", "quantized", "faiss"], default="chroma",
+                    help="法律條文向量來源：Chroma、batch_cap4_1.0.py --quantize 產生的 ./law_vectors，"
+                         "或 faiss_store.py 產生的 ./law_faiss")
 args = parser.parse_args()
 
 GENERATOR_MODEL = args.generator
 VERIFIER_MODEL = args.verifier
 
+# Streamlit 每次互動都會由頭到尾重跑整個檔案；下面的重資源都以 st.cache_resource 建立，
+# 每個 server process 只初始化一次，跨 rerun / session 共用（索引重建後依檔案版本自動換新）。
+st.set_page_config(page_title="合約 + 法律分析系統", layout="wide")
+
 # ==========================
 # Ollama 設定
 # ==========================
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-
-def call_ollama(model_name, prompt, max_tokens=500):
-    payload = {
-        "model": model_name,
-        "prompt": prompt,
-        "options": {"temperature": 0.3},
-        "stream": False
-    }
-    resp = requests.post(OLLAMA_API_URL, json=payload)
-    if resp.status_code == 200:
-        return resp.json().get("response", "").strip()
-    else:
-        return f"❌ Ollama 請求失敗: {resp.text}"
+# 共用 ollama_client：keep-alive 連線池、timeout、重試，並按任務限制生成長度（num_predict）
+ollama = get_ollama_client()
+
+def call_ollama(model_name, prompt, task="default"):
+    try:
+        return ollama.generate(model_name, prompt, task=task)
+    except OllamaError as e:
+        return f"❌ {e}"
+
+def stream_ollama(placeholder, model_name, prompt, task="default", header=""):
+    """把 Ollama 的串流逐段畫到 placeholder；回傳 (全文, timings)，失敗時全文為「❌ …」"""
+    timings = {}
+    text = ""
+    try:
+        for piece in ollama.generate_stream(model_name, prompt, task=task, timings=timings):
+            text += piece
+            placeholder.markdown(header + text + "▌")
+    except OllamaError as e:
+        return f"❌ {e}", timings
+    return text.strip(), timings
 
 # ==========================
 # 初始化向量資料庫
 # ==========================
-client = chromadb.PersistentClient(path="./chroma_db")
-laws_collection = client.get_collection(
-    name="hk_cap4_laws", embedding_function=GTEEmbeddingFunction("thenlper/gte-large-zh")
-)
-contracts_collection = client.get_or_create_collection(
-    name="contracts", embedding_function=GTEEmbeddingFunction("thenlper/gte-large-zh")
-)
+LAW_VECTOR_PATHS = {"quantized": "./law_vectors", "faiss": "./law_faiss"}
+
+@st.cache_resource
+def get_chroma_client():
+    return chromadb.PersistentClient(path="./chroma_db")
+
+# 法律條文、合約與 cascade 共用同一個 gte-large-zh（model_registry 只載入一份）；
+# embedding 都經本地快取：重複的問題 / 條款不會再送進模型
+embedder = get_embedding_function()
+
+@st.cache_resource(max_entries=1)
+def get_law_store(law_vectors, version):
+    """回傳 (向量庫, 來源名稱)；version 為向量庫檔案版本，重新入庫後換新"""
+    if law_vectors == "quantized":
+        # int8 / float16 向量常駐記憶體，前幾名候選再以 float32 精確重算；query() 介面與 Chroma 相同
+        return QuantizedVectorStore.load(LAW_VECTOR_PATHS["quantized"], embedding_function=embedder), "Quantized"
+    if law_vectors == "faiss":
+        from faiss_store import FaissVectorStore   # 只有選用時才需要 faiss
+        return FaissVectorStore.load(LAW_VECTOR_PATHS["faiss"], embedding_function=embedder), "FAISS"
+    return get_chroma_client().get_collection(name="hk_cap4_laws", embedding_function=embedder), "Chroma"
+
+@st.cache_resource
+def get_contracts_collection():
+    return get_chroma_client().get_or_create_collection(name="contracts", embedding_function=embedder)
+
+LAW_VECTORS_VERSION = file_version(os.path.join(LAW_VECTOR_PATHS.get(args.law_vectors, "./chroma_db"), "meta.json"))
+laws_collection, VECTOR_SOURCE = get_law_store(args.law_vectors, LAW_VECTORS_VERSION)
+contracts_collection = get_contracts_collection()
 
 # ==========================
 # BM25 (載入索引)
 # ==========================
-with open("bm25_index.pkl", "rb") as f:
-    bm25_data = pickle.load(f)
-bm25 = bm25_data["bm25"]
-bm25_chunks = bm25_data["chunks"]
+@st.cache_resource(max_entries=1)
+def get_bm25_index(version):
+    index = BM25Index.load("bm25_index")   # postings 以 mmap 載入，不需反序列化
+    init_jieba()   # 啟動時就載入詞典，第一個查詢不用再等
+    return index
+
+BM25_VERSION = file_version("bm25_index/meta.json")
+bm25_index = get_bm25_index(BM25_VERSION)
 
-embedder = SentenceTransformer("thenlper/gte-large-zh")
-reranker = CrossEncoder("BAAI/bge-reranker-large")
+# 並發的查詢共用一個微批次 reranker（model_registry 內的單例，背景 thread 與模型不隨 rerun 重複建立）；
+# 外層快取 (問題, 條文) 的分數，追問時只為新的條文評分
+reranker = get_reranker()
+
+@st.cache_resource
+def get_prefilter(kind, model_name):
+    return build_prefilter(kind, embedding_fn=embedder, model_name=model_name)
+
+prefilter = get_prefilter(args.cascade, args.cascade_model)
+
+@st.cache_resource
+def get_active_retriever():
+    # 目前使用中的 retriever；cache_resource 淘汰舊的 retriever 時不會做任何清理，由 get_retriever 關閉
+    return {}
+
+@st.cache_resource(max_entries=1)
+def get_retriever(_vector_store, _bm25_index, vector_source, law_version, bm25_version, vector_timeout, bm25_timeout):
+    # 向量與 BM25 同時檢索，各自有時限；thread pool 隨 retriever 只建立一次
+    # （底線開頭的參數不參與快取 key，由 vector_source 與兩個版本字串代表）
+    retriever = HybridRetriever(_vector_store, _bm25_index, tokenize=tokenize_query, vector_source=vector_source,
+                                vector_timeout=vector_timeout, bm25_timeout=bm25_timeout)
+    active = get_active_retriever()
+    if active.get("retriever") is not None:
+        active["retriever"].close()   # 重新入庫後換新：舊 retriever 的 thread pool 不會自己結束
+    active["retriever"] = retriever
+    return retriever
+
+retriever = get_retriever(laws_collection, bm25_index, VECTOR_SOURCE, LAW_VECTORS_VERSION, BM25_VERSION,
+                          args.vector_timeout, args.bm25_timeout)
+
+@st.cache_resource(show_spinner="🔥 首次啟動：載入模型並暖機中 ...")
+def warm_up():
+    """每個 server process 只跑一次：先各跑一次 embedding / BM25 / reranker，第一個真正的查詢不必等模型初始化"""
+    timings = {}
+    t0 = time.perf_counter()
+    get_encoder().encode(["暖機"])   # 直接呼叫模型，不經 embedding 快取
+    timings["embedding"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    bm25_index.top_k(tokenize_query("暖機"), k=1)
+    timings["bm25"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    get_cross_encoder().predict([("暖機", "暖機")], show_progress_bar=False)
+    if prefilter is not None:
+        prefilter.predict([("暖機", "暖機")])
+    timings["rerank"] = time.perf_counter() - t0
+    print("🔥 暖機完成：" + "，".join(f"{name} {sec:.2f}s" for name, sec in timings.items()))
+    return timings
+
+warm_up()
 
 # ==========================
 # Hybrid Search
 # ==========================
-def hybrid_search(query: str, n=10):
-    vector_results = laws_collection.query(
-        query_texts=[query],
-        n_results=n,
-        include=["documents", "metadatas", "distances"]
-    )
-    vector_docs = vector_results["documents"][0]
-    vector_metas = vector_results["metadatas"][0]
-    vector_scores = vector_results["distances"][0]
+def hybrid_search(query: str, n=10, caps=None, sections=None):
+    # 向量與 BM25 各取 n 個候選，以 chunk id 去重、RRF 名次融合（見 retrieval_engine.py）
+    # caps / sections 篩選同時推到向量庫與 BM25，只在指定條例內檢索
+    # 回傳 (候選, 各路耗時)
+    return retriever.search_with_timings(query, n=n, caps=caps, sections=sections)
 
-    vector_candidates = [
-        (doc, meta, 1 - score, "Chroma")
-        for doc, meta, score in zip(vector_docs, vector_metas, vector_scores)
-    ]
+def parse_section_range(text):
+    """「1-20」→ (1, 20)；「5」→ (5, 5)；「10-」/「-3」為單邊範圍；空白或格式不符時不篩選"""
+    text = text.strip()
+    if not text:
+        return None
+    lo, sep, hi = text.partition("-")
+    try:
+        lo = int(lo) if lo.strip() else None
+        hi = int(hi) if hi.strip() else None
+    except ValueError:
+        st.warning(f"⚠️ 條號範圍格式不正確：{text}（例如 1-20）")
+        return None
+    return (lo, hi) if sep else (lo, lo)
 
-    tokenized_query = list(jieba.cut(query))
-    bm25_scores = bm25.get_scores(tokenized_query)
-    top_idx = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:n]
+def rerank(query, candidates, top_k=3):
+    return rerank_candidates(reranker, query, candidates, top_k=top_k, prefilter=prefilter, keep=args.cascade_keep)
 
-    bm25_candidates = [
-        (bm25_chunks[i]["text"], bm25_chunks[i], bm25_scores[i], "BM25") for i in top_idx
-    ]
+@st.cache_resource
+def get_query_cache():
+    # 跨 rerun / session 共用；重新入庫（BM25 索引 / 量化向量庫 / FAISS 重寫）後自動失效
+    return QueryCache(version_fn=lambda: file_version("bm25_index/meta.json", "law_vectors/meta.json",
+                                                      "law_faiss/meta.json"))
 
-    merged = {}
-    for doc, meta, score, source in vector_candidates + bm25_candidates:
-        if doc not in merged or score > merged[doc][1]:
-            merged[doc] = (meta, score, source)
+query_cache = get_query_cache()
 
-    return [(doc, meta, score, source) for doc, (meta, score, source) in merged.items()]
+def search_and_rerank(query, n=10, top_k=3, caps=None, sections=None):
+    """檢索 + rerank（經查詢快取）；回傳 (reranked, timings)，命中快取時 timings 為 None"""
+    timings = {}
 
-def rerank(query, candidates, top_k=3):
-    pairs = [(query, doc) for doc, _, _, _ in candidates]
-    scores = reranker.predict(pairs)
-    ranked = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
-    return ranked[:top_k]
+    def compute():
+        candidates, t = hybrid_search(query, n=n, caps=caps, sections=sections)
+        timings.update(t)
+        return rerank(query, candidates, top_k=top_k)
+
+    def complete():
+        # 有一路逾時 / 出錯時結果只來自另一路，不快取，下次查詢重試
+        return all(timings[name]["status"] == "ok" for name in ("vector", "bm25"))
+
+    reranked, hit = query_cache.get_or_compute(query, compute, cacheable=complete,
+                                               n=n, top_k=top_k, vectors=args.law_vectors,
+                                               cascade=args.cascade, cascade_keep=args.cascade_keep,
+                                               caps=tuple(caps or ()), sections=sections)
+    return reranked, (None if hit else timings)
 
 # ==========================
 # 雙 LLM Pipeline
 # ==========================
-def generate_answer(query, context_texts):
-    prompt = (
+def answer_prompt(query, context_texts):
+    return (
         "你是一位香港法律輔助助手，請根據以下條文生成初步回答：\n\n"
         f"條文：\n{chr(10).join(context_texts)}\n\n問題：{query}"
     )
-    return call_ollama(GENERATOR_MODEL, prompt, max_tokens=512)
 
-def verify_answer(query, draft_answer, context_texts):
-    prompt = (
+def verify_prompt(query, draft_answer, context_texts):
+    return (
         "你是一位嚴謹的法律審核助手。以下是初步回答與法律條文：\n\n"
         f"問題：{query}\n\n"
         f"初步回答：{draft_answer}\n\n"
         f"條文：\n{chr(10).join(context_texts)}\n\n"
         "請檢查並修正錯誤，補充遺漏，並加強引用，保持繁體中文。"
     )
-    return call_ollama(VERIFIER_MODEL, prompt, max_tokens=700)
+
+def generate_answer(query, context_texts, task="law"):
+    return call_ollama(GENERATOR_MODEL, answer_prompt(query, context_texts), task=task)
+
+def verify_answer(query, draft_answer, context_texts):
+    return call_ollama(VERIFIER_MODEL, verify_prompt(query, draft_answer, context_texts), task="verify")
+
+def answer_and_verify(query, context_texts, task, placeholder):
+    """生成 + 複核，結果畫在 placeholder；回傳 (最終回答, 初稿)
+
+    串流時初稿邊生成邊顯示，複核的輸出再逐段取代初稿；首個 token 延遲（TTFT）是使用者實際等待的時間，
+    以它為主要延遲指標。--no-stream 時等兩段都完成才顯示。
+    """
+    if args.no_stream:
+        with st.spinner("生成中..."):
+            draft = generate_answer(query, context_texts, task=task)
+            final = draft if draft.startswith("❌") else verify_answer(query, draft, context_texts)
+        placeholder.write(final)
+        return final, draft
+
+    draft, t_draft = stream_ollama(placeholder, GENERATOR_MODEL, answer_prompt(query, context_texts), task=task,
+                                   header="📝 **初稿**（生成中）\n\n")
+    if draft.startswith("❌"):
+        placeholder.error(draft)
+        return draft, draft
+    final, t_verify = stream_ollama(placeholder, VERIFIER_MODEL, verify_prompt(query, draft, context_texts),
+                                    task="verify", header="🔍 **複核中**\n\n")
+    with placeholder.container():
+        if final.startswith("❌"):
+            st.error(final)
+        else:
+            st.write(final)
+        st.caption(
+            f"⚡ 首個 token {t_draft.get('ttft_ms', 0):.0f} ms｜初稿 {t_draft.get('total_ms', 0) / 1000:.1f} s｜"
+            f"複核 {t_verify.get('total_ms', 0) / 1000:.1f} s（首個 token {t_verify.get('ttft_ms', 0):.0f} ms）"
+        )
+    return final, draft
+
+# ==========================
+# 合約分析快取
+# ==========================
+PROMPT_VERSION = 1   # 修改 generate_answer / verify_answer 的提示詞時加一，舊的分析結果即失效
+
+@st.cache_resource
+def get_analysis_cache():
+    # 跨 rerun / session 共用；key 為 (合約內容 hash, 條款序號或任務, 模型組合, 提示詞版本)
+    return QueryCache(max_entries=20000, ttl=7 * 24 * 3600)
+
+analysis_cache = get_analysis_cache()
+
+def analyze_cached(contract_hash, task, question, context_texts, placeholder):
+    """生成 + 複核，結果畫在 placeholder；只有快取裡沒有的才送到 Ollama，失敗的結果不快取（下次重試）"""
+    params = {"generator": GENERATOR_MODEL, "verifier": VERIFIER_MODEL, "prompt_version": PROMPT_VERSION}
+    key = f"{contract_hash}:{task}"
+    analysis = analysis_cache.get(key, **params)
+    if analysis is not None:
+        placeholder.write(analysis)
+        return analysis
+    analysis, draft = answer_and_verify(question, context_texts, task.split(":")[0], placeholder)
+    if not (draft.startswith("❌") or analysis.startswith("❌")):
+        analysis_cache.put(key, analysis, **params)
+    return analysis
+
+@st.cache_data(show_spinner=False)
+def load_uploaded_contract(contract_hash, file_name, _data):
+    """同一份合約只寫入 ./contracts 與解析一次；回傳 (全文, 條款 list)"""
+    path = f"./contracts/{file_name}"
+    existing = None
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            existing = hashlib.sha256(f.read()).hexdigest()
+    if existing != contract_hash:
+        with open(path, "wb") as f:
+            f.write(_data)
+    text = load_contract(path)
+    return text, split_into_clauses(text, max_len=600)
 
 # ==========================
 # Streamlit UI
 # ==========================
-st.set_page_config(page_title="合約 + 法律分析系統", layout="wide")
 st.title("📑 本地合約 + 法律分析系統（Ollama + 雙 LLM + RAG）")
 
 uploaded_file = st.file_uploader("📂 上傳合約 (PDF / DOCX / TXT)", type=["pdf", "docx", "txt"])
 
 if uploaded_file:
-    with open(f"./contracts/{uploaded_file.name}", "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    text = load_contract(f"./contracts/{uploaded_file.name}")
-    clauses = split_into_clauses(text, max_len=600)
+    data = uploaded_file.getvalue()
+    contract_hash = hashlib.sha256(data).hexdigest()
+    text, clauses = load_uploaded_contract(contract_hash, uploaded_file.name, data)
 
     st.success(f"✅ 成功載入合約，共 {len(clauses)} 個條款")
 
@@ -143,43 +325,39 @@ if uploaded_file:
     # 條款逐條分析
     with tab1:
         for i, clause in enumerate(clauses):
-            with st.spinner(f"分析第 {i+1} 條款中..."):
-                draft = generate_answer(clause, [clause])
-                analysis = verify_answer(clause, draft, [clause])
-                clause_analyses.append((clause, analysis))
-                st.markdown(f"### 條款 {i+1}")
-                st.info(clause)
-                st.write(analysis)
+            st.markdown(f"### 條款 {i+1}")
+            st.info(clause)
+            analysis = analyze_cached(contract_hash, f"clause:{i}", clause, [clause], st.empty())
+            clause_analyses.append((clause, analysis))
 
     # 合約摘要
     with tab2:
-        with st.spinner("正在生成合約摘要..."):
-            draft_summary = generate_answer("請總結此合約", [text[:6000]])
-            summary = verify_answer("請總結此合約", draft_summary, [text[:6000]])
         st.subheader("📌 合約摘要")
-        st.write(summary)
+        summary = analyze_cached(contract_hash, "summary", "請總結此合約", [text[:6000]], st.empty())
 
     # 風險重點
     with tab3:
-        with st.spinner("正在生成風險重點..."):
-            draft_risks = generate_answer("請找出合約中的風險", [text[:6000]])
-            risks = verify_answer("請找出合約中的風險", draft_risks, [text[:6000]])
         st.subheader("⚠️ 風險重點")
-        st.write(risks)
+        risks = analyze_cached(contract_hash, "risks", "請找出合約中的風險", [text[:6000]], st.empty())
 
     # 法律檢索
     with tab4:
         query = st.text_input("輸入法律問題（結合 RAG 檢索）")
+        cap_filter = st.multiselect("限定條例（Cap，可留空）", bm25_index.caps())
+        section_filter = parse_section_range(st.text_input("條號範圍（例如 1-20，可留空）"))
         if query:
-            candidates = hybrid_search(query, n=10)
-            reranked = rerank(query, candidates, top_k=3)
+            reranked, timings = search_and_rerank(query, n=10, top_k=3, caps=cap_filter, sections=section_filter)
+            if timings is None:
+                st.caption(f"⚡ 查詢快取命中（命中率 {query_cache.stats()['hit_rate']:.0%}）")
+            else:
+                st.caption(
+                    f"⏱️ 向量 {timings['vector']['ms']} ms（{timings['vector']['status']}）｜"
+                    f"BM25 {timings['bm25']['ms']} ms（{timings['bm25']['status']}）｜檢索合計 {timings['total_ms']} ms"
+                )
             context_texts = [doc for (doc, _, _, _), _ in reranked]
 
-            draft_answer = generate_answer(query, context_texts)
-            final_answer = verify_answer(query, draft_answer, context_texts)
-
             st.subheader("🧠 法律回答")
-            st.write(final_answer)
+            final_answer, _ = answer_and_verify(query, context_texts, "law", st.empty())
 
 # 報告下載
 def generate_word_report(summary, risks, clause_analyses):
@@ -211,14 +389,20 @@ def save_json_report(summary, risks, clause_analyses, filename="contract_analysi
     return filename
 
 if uploaded_file:
-    if st.button("📥 下載 Word 報告"):
-        buf = generate_word_report(summary, risks, clause_analyses)
-        st.download_button(
-            label="⬇️ 下載合約分析報告 (Word)",
-            data=buf,
-            file_name="contract_report.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
+    # 分析結果都來自 analysis_cache，按下載時的 rerun 不會重新分析；直接給 download_button，
+    # 不再包在 st.button 裡（按鈕狀態在下一次 rerun 就會消失）
+    st.download_button(
+        label="⬇️ 下載合約分析報告 (Word)",
+        data=generate_word_report(summary, risks, clause_analyses),
+        file_name="contract_report.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
     if st.button("📥 下載 JSON 報告"):
         json_file = save_json_report(summary, risks, clause_analyses)
         st.success(f"✅ JSON 記錄已保存到本地：{json_file}")
+
+# 串流的首個 token 延遲（TTFT）：使用者看到第一個字要等多久
+ollama_stats = ollama.stats()
+if ollama_stats["avg_ttft_ms"] is not None:
+    st.sidebar.metric("⚡ 平均首個 token 延遲", f"{ollama_stats['avg_ttft_ms']:.0f} ms",
+                      help=f"本 process 共 {ollama_stats['streams']} 次串流生成")
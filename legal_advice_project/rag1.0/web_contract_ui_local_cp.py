@@ -1,5 +1,4 @@
 import os
-import requests
 import streamlit as st
 import chromadb
 from contract_ingest import load_contract, split_into_clauses, GTEEmbeddingFunction
@@ -9,11 +8,13 @@ import io
 from docx import Document
 import json
 from datetime import datetime
+from embedding_cache import with_embedding_cache
+from ollama_client import OllamaError, get_client as get_ollama_client
 
 # ==========================
 # Ollama 設定
 # ==========================
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+ollama = get_ollama_client()   # 共用連線池、timeout、重試與各任務的生成長度上限
 
 AVAILABLE_MODELS = [
     "qwen3:4b",
@@ -23,28 +24,28 @@ AVAILABLE_MODELS = [
     "mistral:7b-instruct"
 ]
 
-def call_ollama(prompt, model_name, max_tokens=500):
-    payload = {
-        "model": model_name,
-        "prompt": prompt,
-        "options": {"temperature": 0.7},
-        "stream": False
-    }
-    resp = requests.post(OLLAMA_API_URL, json=payload)
-    if resp.status_code == 200:
-        return resp.json().get("response", "").strip()
-    else:
-        return f"❌ Ollama 請求失敗: {resp.text}"
+def call_ollama(prompt, model_name, placeholder, max_tokens=500, task="default"):
+    """串流生成，邊收邊畫到 placeholder；回傳完整文字，失敗時為「❌ …」"""
+    text = ""
+    try:
+        for piece in ollama.generate_stream(model_name, prompt, task=task, num_predict=max_tokens, temperature=0.7):
+            text += piece
+            placeholder.markdown(text + "▌")
+    except OllamaError as e:
+        text = f"❌ {e}"
+    text = text.strip()
+    placeholder.write(text)
+    return text
 
 # ==========================
 # 初始化向量資料庫
 # ==========================
 client = chromadb.PersistentClient(path="./chroma_db")
 laws_collection = client.get_collection(
-    name="hk_cap4_laws", embedding_function=GTEEmbeddingFunction("thenlper/gte-large-zh")
+    name="hk_cap4_laws", embedding_function=with_embedding_cache(GTEEmbeddingFunction("thenlper/gte-large-zh"))
 )
 contracts_collection = client.get_or_create_collection(
-    name="contracts", embedding_function=GTEEmbeddingFunction("thenlper/gte-large-zh")
+    name="contracts", embedding_function=with_embedding_cache(GTEEmbeddingFunction("thenlper/gte-large-zh"))
 )
 
 # ==========================
@@ -73,8 +74,9 @@ if uploaded_file:
     # 條款逐條分析
     with tab1:
         for i, clause in enumerate(clauses):
-            with st.spinner(f"分析第 {i+1} 條款中..."):
-                prompt = f"""
+            st.markdown(f"### 條款 {i+1}")
+            st.info(clause)
+            prompt = f"""
 請閱讀以下合約條款，並分析：
 1. 條款摘要
 2. 潛在風險與爭議
@@ -83,27 +85,20 @@ if uploaded_file:
 條款內容：
 {clause}
 """
-                analysis = call_ollama(prompt, selected_model, max_tokens=500)
-                clause_analyses.append((clause, analysis))
-                st.markdown(f"### 條款 {i+1}")
-                st.info(clause)
-                st.write(analysis)
+            analysis = call_ollama(prompt, selected_model, st.empty(), max_tokens=500, task="clause")
+            clause_analyses.append((clause, analysis))
 
     # 合約摘要
     with tab2:
-        with st.spinner("正在生成合約摘要..."):
-            summary_prompt = f"請閱讀以下合約全文，生成一份簡潔的摘要：\n\n{text[:6000]}"
-            summary = call_ollama(summary_prompt, selected_model, max_tokens=600)
         st.subheader("📌 合約摘要")
-        st.write(summary)
+        summary_prompt = f"請閱讀以下合約全文，生成一份簡潔的摘要：\n\n{text[:6000]}"
+        summary = call_ollama(summary_prompt, selected_model, st.empty(), max_tokens=600, task="summary")
 
     # 風險重點
     with tab3:
-        with st.spinner("正在生成風險重點..."):
-            risk_prompt = f"請閱讀以下合約全文，列出可能存在的風險與爭議條款：\n\n{text[:6000]}"
-            risks = call_ollama(risk_prompt, selected_model, max_tokens=600)
         st.subheader("⚠️ 風險重點")
-        st.write(risks)
+        risk_prompt = f"請閱讀以下合約全文，列出可能存在的風險與爭議條款：\n\n{text[:6000]}"
+        risks = call_ollama(risk_prompt, selected_model, st.empty(), max_tokens=600, task="risks")
 
 # ====== 生成 Word 報告函式 ======
 def generate_word_report(summary, risks, clause_analyses):